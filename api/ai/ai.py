@@ -5,10 +5,12 @@ import uuid
 from fastapi import APIRouter, Depends
 from starlette.responses import StreamingResponse
 
+from core.ai import embeddings
 from core.deps import get_current_user_id
 from middleware.exception import BusinessException
 from models.schemas.ai import AiRequest
 from services.ai import ai_service
+from services.answer_cache import semantic_answer_cache
 from utils.response import APIResponse
 
 ai_router = APIRouter(prefix='/ai')
@@ -29,6 +31,34 @@ async def chat(
     return StreamingResponse(generator, media_type='text/event-stream')
 
 
+@ai_router.get('/embedding-cache-stats')
+async def embedding_cache_stats(
+        user_id: int = Depends(get_current_user_id),
+):
+    """
+    查询向量缓存命中指标
+
+    local_hits 进程内缓存命中数, redis_hits Redis 缓存命中数, misses 调用向量化接口数, hit_rate 命中率
+    """
+    if not user_id:
+        raise BusinessException(message="用户未登录", code=401)
+    return APIResponse.success(data=embeddings.stats())
+
+
+@ai_router.get('/answer-cache-stats')
+async def answer_cache_stats(
+        user_id: int = Depends(get_current_user_id),
+):
+    """
+    语义答案缓存命中指标
+
+    hits 命中数, misses 未命中数, hit_rate 命中率, top_questions 命中次数最多的问题摘要（不含问题原文）
+    """
+    if not user_id:
+        raise BusinessException(message="用户未登录", code=401)
+    return APIResponse.success(data=await semantic_answer_cache.stats())
+
+
 @ai_router.post('/chat/create-session')
 async def create_session(
         user_id: int = Depends(get_current_user_id),
@@ -4,10 +4,13 @@
 from fastapi import APIRouter, Request, Depends
 
 from core.deps import get_current_user
-from models.schemas.behavior import UserBehaviorLogRequest
+from core.rabbitmq_client import rabbitmq_client_manager
+from models.schemas.behavior import UserBehaviorLogRequest, UserBehaviorLogBatchRequest
 from models.schemas.recommendation import RecommendationRequest, RecommendationResponse, RecommendationItem
 from services.behavior_service import user_behavior_service
+from services.hot_course_leaderboard import DEFAULT_WINDOW
 from services.recommendation import item_cf_recommender
+from services.recommender_factory import RecommenderFactory
 from utils.response import APIResponse
 
 recommendation_router = APIRouter(prefix='/recommendation')
@@ -42,6 +45,32 @@ async def record_behavior(
     return APIResponse.error(message="行为记录失败")
 
 
+@recommendation_router.post('/record-behaviors')
+async def record_behaviors(
+    request_data: UserBehaviorLogBatchRequest,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    批量记录用户行为（单次最多100条）
+    
+    用于前端缓冲的浏览、滚动等高频事件，课程不存在的行为被跳过并在 rejected 中返回下标
+    """
+    user_id = current_user.get("user_id")
+    rejected = await user_behavior_service.record_behaviors(
+        user_id=user_id,
+        items=request_data.items,
+        request=request
+    )
+    
+    if rejected is None:
+        return APIResponse.error(message="行为记录失败")
+    return APIResponse.success(
+        data={"accepted": len(request_data.items) - len(rejected), "rejected": rejected},
+        message="行为记录成功"
+    )
+
+
 @recommendation_router.post('/course-recommend')
 async def get_course_recommendations(
     request_data: RecommendationRequest,
@@ -50,11 +79,18 @@ async def get_course_recommendations(
     """
     获取课程推荐列表
     
-    基于物品的协同过滤算法，混合用户行为和课程属性相似度
+    算法:
+    - item_cf: 基于物品的协同过滤，混合用户行为和课程属性相似度
+    - als: 隐式反馈矩阵分解
     """
     user_id = current_user.get("user_id")
     
-    recommendations = await item_cf_recommender.get_recommendations(
+    try:
+        recommender = RecommenderFactory.get_recommender(request_data.algorithm)
+    except ValueError as e:
+        return APIResponse.error(message=str(e))
+    
+    recommendations = await recommender.get_recommendations(
         user_id=user_id,
         top_n=request_data.top_n,
         exclude_interacted=request_data.exclude_interacted
@@ -115,14 +151,33 @@ async def record_purchase_behavior(
 
 
 @recommendation_router.post('/hot-courses')
-async def get_hot_courses(top_n: int = 10):
+async def get_hot_courses(top_n: int = 10, window: str = DEFAULT_WINDOW):
     """
     获取热门课程（不需要登录）
     用于首页展示或新用户推荐
+    
+    时间窗口:
+    - hour: 近一小时热度
+    - day: 近一天热度
+    - week: 近一周热度
     """
-    hot_courses = await item_cf_recommender._get_hot_courses(top_n)
+    hot_courses = await item_cf_recommender._get_hot_courses(top_n, window=window)
     
     return APIResponse.success(data={
         "total": len(hot_courses),
         "courses": hot_courses
     })
+
+
+@recommendation_router.get('/consumer-metrics')
+async def get_consumer_metrics(current_user: dict = Depends(get_current_user)):
+    """
+    获取消息队列运行指标
+    
+    consumers: in_flight 已取出未确认的消息数, processed 处理成功数, failed 最终处理失败数, dead_lettered 转存死信队列数, redelivered 整批重新投递数
+    publisher: backlog 待发布积压数, published 已确认发布数, failed 发布失败数, dropped 丢弃数, spilled/replayed 溢出/回放数
+    """
+    return APIResponse.success(data={
+        "consumers": rabbitmq_client_manager.get_consumer_metrics(),
+        "publisher": rabbitmq_client_manager.get_publisher_metrics()
+    })
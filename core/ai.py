@@ -1,15 +1,39 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from langchain.chat_models import init_chat_model
 from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_community.embeddings.dashscope import embed_with_retry
 from langchain_postgres import PGVector
 
 from core.config import settings
+from core.embedding_cache import CachedEmbeddings
 
-embeddings = DashScopeEmbeddings(
+dashscope_embeddings = DashScopeEmbeddings(
     model="text-embedding-v1",
     dashscope_api_key=os.getenv("DASHSCOPE_API_KEY"))
 
+
+def _embed_queries(texts: list[str]) -> list[list[float]]:
+    """
+    批量生成查询向量（同步，不经过缓存）
+    与 DashScopeEmbeddings.embed_query 一样按 query 类型编码，多条文本合并为一次请求（超过接口单批上限时自动分批）
+    """
+    if not texts:
+        return []
+    results = embed_with_retry(
+        dashscope_embeddings, input=texts, text_type="query", model=dashscope_embeddings.model
+    )
+    return [item["embedding"] for item in results]
+
+
+# 查询向量带两级缓存，向量库检索和多路检索共用
+embeddings = CachedEmbeddings(
+    dashscope_embeddings,
+    model_name=dashscope_embeddings.model,
+    embed_queries=_embed_queries
+)
+
 vector_store = PGVector(
     embeddings=embeddings,
     collection_name=settings.collection_name,
@@ -17,6 +41,20 @@ vector_store = PGVector(
     use_jsonb=True,
     create_extension=True,
 )
+# 语义答案缓存（历史问题向量 -> 答案）
+answer_cache_store = PGVector(
+    embeddings=embeddings,
+    collection_name=settings.answer_cache_collection_name,
+    connection=settings.database_vector_url,
+    use_jsonb=True,
+    create_extension=False,
+)
+# 向量化、PGVector 检索均为同步阻塞调用，统一在有界线程池中执行，避免阻塞事件循环
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=settings.rag_retrieval_workers,
+    thread_name_prefix="rag-retrieval"
+)
+
 llm = init_chat_model(
     model='qwen-flash',
     model_provider='openai',
@@ -0,0 +1,101 @@
+"""
+CPU 密集型计算进程池
+NumPy/SciPy 的矩阵计算大多不释放 GIL，直接在协程里执行会阻塞整个事件循环，
+这里统一提交到独立进程执行，并提供：
+- 有界队列：排队任务超过上限时直接拒绝，由调用方走降级逻辑
+- 请求合并：相同 key 的并发计算只执行一次，共享结果
+- 超时：调用方等待超时后放弃等待（已开始的计算会继续完成，结果仍可被合并的请求使用）
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Hashable
+
+from core.config import settings
+
+logger = logging.getLogger("api")
+
+
+class ComputePoolBusyError(RuntimeError):
+    """计算池排队任务已满"""
+
+
+class ComputePool:
+    """CPU 密集型计算进程池管理器"""
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn 启动子进程，避免 fork 继承事件循环和连接池
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def run(self, func: Callable, *args, key: Hashable | None = None, timeout: float | None = None) -> Any:
+        """
+        在进程池中执行函数
+        :param func: 模块级函数（需可被 pickle）
+        :param args: 参数（需可被 pickle）
+        :param key: 合并键，相同 key 的并发调用共享一次计算
+        :param timeout: 等待超时（秒），None 表示一直等待
+        :raises ComputePoolBusyError: 排队任务已满
+        :raises asyncio.TimeoutError: 等待超时
+        """
+        future = self._inflight.get(key) if key is not None else None
+        if future is None:
+            if self._pending >= self._max_pending:
+                raise ComputePoolBusyError("计算任务排队已满")
+
+            executor = self.executor
+            try:
+                future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # 子进程异常退出（如构建时 OOM）后进程池不可用，重建后重试一次
+                self._reset_executor(executor)
+                executor = self.executor
+                future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+            self._pending += 1
+            if key is not None:
+                self._inflight[key] = future
+            future.add_done_callback(lambda _: self._on_done(key, future, executor))
+
+        # shield：单个调用方超时或取消不影响其他合并的调用方
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def _on_done(self, key: Hashable | None, future: asyncio.Future, executor: ProcessPoolExecutor):
+        self._pending -= 1
+        if key is not None and self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 无人等待时也要取出异常，避免 "exception was never retrieved" 警告
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._reset_executor(executor)
+
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        """丢弃已损坏的进程池，下次提交时重建（已被其他调用重建时不处理）"""
+        if self._executor is executor:
+            logger.error("计算进程池子进程异常退出，重建进程池")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+compute_pool = ComputePool(
+    max_workers=settings.compute_pool_workers,
+    max_pending=settings.compute_pool_max_pending
+)
@@ -0,0 +1,151 @@
+"""
+查询向量缓存
+医疗问题在用户间重复度很高，问题改写、多路扩展得到的检索词经常完全相同，这里缓存查询向量：
+- 一级：进程内 LRU（带 TTL）
+- 二级：Redis，多个进程共享，值为 float32 紧凑字节
+缓存键由模型名和归一化后的文本（全半角、大小写、空白、句末标点）组成，近似重复的问题共用同一向量。
+向量化在检索线程池中同步执行，Redis 二级缓存使用独立的同步客户端（不解码响应，直接存取字节）。
+只缓存查询向量，文档入库向量化（embed_documents）直接透传。
+"""
+import hashlib
+import logging
+import threading
+import unicodedata
+from typing import Callable
+
+import numpy as np
+import redis
+from langchain_core.embeddings import Embeddings
+
+from core.config import settings
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger("api")
+
+# 归一化时去掉的句末标点
+TRAILING_PUNCTUATION = "?？!！。.~～ "
+
+
+class CachedEmbeddings(Embeddings):
+    """带两级缓存的向量化包装，对 PGVector 等调用方透明"""
+
+    KEY_PREFIX = "embedding:query"
+    # Redis 读写超时（秒），超时按未命中处理，不阻塞检索
+    REDIS_TIMEOUT = 0.5
+
+    def __init__(self, embeddings: Embeddings, model_name: str,
+                 embed_queries: Callable[[list[str]], list[list[float]]] | None = None):
+        """
+        :param embeddings: 被包装的向量化实现
+        :param model_name: 模型名（参与缓存键，换模型后不会读到旧向量）
+        :param embed_queries: 批量生成查询向量的实现，缺省逐条调用 embed_query
+        """
+        self._embeddings = embeddings
+        self._model_name = model_name
+        self._embed_queries = embed_queries or (lambda texts: [embeddings.embed_query(text) for text in texts])
+        self._cache = TTLCache(maxsize=settings.embedding_cache_size, ttl=settings.embedding_cache_ttl)
+        # 检索线程池并发访问本地缓存和计数
+        self._lock = threading.Lock()
+        self._redis: redis.Redis | None = None
+        self._local_hits = 0
+        self._redis_hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """归一化查询文本：全角转半角、小写、合并空白、去掉句末标点"""
+        text = unicodedata.normalize("NFKC", text).lower()
+        return " ".join(text.split()).rstrip(TRAILING_PUNCTUATION)
+
+    def _key(self, normalized: str) -> str:
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{self._model_name}:{digest}"
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(
+                settings.redis_url,
+                socket_timeout=self.REDIS_TIMEOUT,
+                socket_connect_timeout=self.REDIS_TIMEOUT
+            )
+        return self._redis
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        批量生成查询向量，未命中的文本去重后合并为一次向量化请求
+        :return: 与 texts 顺序一致的向量
+        """
+        keys = [self._key(self.normalize(text)) for text in texts]
+        vectors: dict[str, list[float]] = {}
+        missing: dict[str, str] = {}
+
+        with self._lock:
+            for key, text in zip(keys, texts):
+                vector = self._cache.get(key)
+                if vector is not None:
+                    vectors[key] = vector
+                    self._local_hits += 1
+                elif key not in missing:
+                    missing[key] = text
+
+        # 本地未命中的从 Redis 批量取回
+        if missing:
+            self._load_from_redis(missing, vectors)
+
+        # Redis 也未命中的一次向量化
+        if missing:
+            computed = dict(zip(missing, self._embed_queries(list(missing.values()))))
+            with self._lock:
+                self._misses += len(computed)
+                for key, vector in computed.items():
+                    self._cache.set(key, vector)
+            vectors.update(computed)
+            self._store_to_redis(computed)
+
+        return [vectors[key] for key in keys]
+
+    def _load_from_redis(self, missing: dict[str, str], vectors: dict[str, list[float]]):
+        """从 Redis 读取向量写入 vectors，并从 missing 中移除命中的键（Redis 不可用时全部视为未命中）"""
+        try:
+            values = self.redis.mget(list(missing))
+        except Exception as e:
+            logger.error(f"读取查询向量缓存失败: {e}")
+            return
+
+        with self._lock:
+            for key, value in zip(list(missing), values):
+                if value is None:
+                    continue
+                vector = np.frombuffer(value, dtype=np.float32).tolist()
+                vectors[key] = vector
+                self._cache.set(key, vector)
+                self._redis_hits += 1
+                del missing[key]
+
+    def _store_to_redis(self, computed: dict[str, list[float]]):
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for key, vector in computed.items():
+                    pipe.set(key, np.asarray(vector, dtype=np.float32).tobytes(), ex=settings.embedding_cache_redis_ttl)
+                pipe.execute()
+        except Exception as e:
+            logger.error(f"写入查询向量缓存失败: {e}")
+
+    def stats(self) -> dict:
+        """缓存命中指标"""
+        with self._lock:
+            total = self._local_hits + self._redis_hits + self._misses
+            return {
+                "local_hits": self._local_hits,
+                "redis_hits": self._redis_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._local_hits + self._redis_hits) / total, 4) if total else 0.0,
+                "local_size": len(self._cache),
+            }
@@ -0,0 +1,117 @@
+"""
+消息编解码
+默认 JSON；注册了字段表的消息类型可使用 msgpack 二进制编码：
+- 按字段表顺序编码为数组，不重复传输字段名
+- 枚举字段编码为序号，时间字段编码为整数微秒
+- 字段表带版本号，随消息头传递；只允许在末尾追加字段，新增字段需新增版本
+编码方式由消息的 content_type 和消息头协商，消费者同时兼容旧的 JSON 消息。
+"""
+import json
+from datetime import datetime, timedelta
+
+import msgpack
+
+from models.schemas.behavior import ActionType
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+
+# 消息头：消息类型与字段表版本
+SCHEMA_HEADER = "x-schema"
+SCHEMA_VERSION_HEADER = "x-schema-version"
+
+# 时间字段编码基准（与 JSON 编码一致，按本地时间的 naive datetime 处理）
+EPOCH = datetime(1970, 1, 1)
+
+# 字段编码方式
+ENUM_FIELDS = {
+    "action_type": [action.value for action in ActionType],
+}
+DATETIME_FIELDS = {"created_time"}
+
+# 消息类型 -> {版本: 字段表}
+SCHEMAS: dict[str, dict[int, tuple[str, ...]]] = {
+    "user_behavior_log": {
+        1: (
+            "user_id", "course_id", "action_type", "action_value",
+            "course_code", "course_name", "medical_department", "difficulty_level",
+            "extra_info", "created_time", "ip_address", "user_agent",
+        ),
+        2: (
+            "user_id", "course_id", "action_type", "action_value",
+            "course_code", "course_name", "medical_department", "difficulty_level",
+            "extra_info", "created_time", "ip_address", "user_agent",
+            "log_id",
+        ),
+    },
+}
+
+
+def _latest_version(schema: str) -> int:
+    return max(SCHEMAS[schema])
+
+
+def _encode_value(field: str, value):
+    if value is None:
+        return None
+    if field in ENUM_FIELDS:
+        return ENUM_FIELDS[field].index(value)
+    if field in DATETIME_FIELDS:
+        # 溢出文件回放的消息经过 JSON（default=str）序列化，时间字段为字符串
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if isinstance(value, datetime):
+            return (value.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+    return value
+
+
+def _decode_value(field: str, value):
+    if value is None:
+        return None
+    if field in ENUM_FIELDS:
+        return ENUM_FIELDS[field][value]
+    if field in DATETIME_FIELDS and isinstance(value, int):
+        # 与 JSON 编码（default=str）得到的字符串一致
+        return str(EPOCH + timedelta(microseconds=value))
+    return value
+
+
+def encode(message_body: dict, schema: str | None = None, binary: bool = True) -> tuple[bytes, str, dict]:
+    """
+    编码消息体
+    :param schema: 消息类型，未注册字段表时使用 JSON
+    :param binary: 是否使用 msgpack 编码
+    :return: (消息体字节, content_type, 消息头)
+    """
+    if not binary or schema not in SCHEMAS:
+        return json.dumps(message_body, ensure_ascii=False, default=str).encode(), JSON_CONTENT_TYPE, {}
+
+    version = _latest_version(schema)
+    fields = SCHEMAS[schema][version]
+    body = msgpack.packb(
+        [_encode_value(field, message_body.get(field)) for field in fields],
+        default=str,
+        use_bin_type=True
+    )
+    return body, MSGPACK_CONTENT_TYPE, {SCHEMA_HEADER: schema, SCHEMA_VERSION_HEADER: version}
+
+
+def decode(body: bytes, content_type: str | None = None, headers: dict | None = None) -> dict:
+    """
+    按 content_type 和消息头解码消息体，缺省按 JSON 解码
+    :raises ValueError: 未知的消息类型或字段表版本
+    """
+    if content_type != MSGPACK_CONTENT_TYPE:
+        return json.loads(body.decode())
+
+    headers = headers or {}
+    schema = headers.get(SCHEMA_HEADER)
+    if isinstance(schema, bytes):
+        schema = schema.decode()
+    version = headers.get(SCHEMA_VERSION_HEADER)
+    fields = SCHEMAS.get(schema, {}).get(version)
+    if fields is None:
+        raise ValueError(f"未知的消息字段表: {schema} v{version}")
+
+    values = msgpack.unpackb(body, raw=False)
+    return {field: _decode_value(field, value) for field, value in zip(fields, values)}
@@ -22,13 +22,15 @@ class MongoDBClientManager:
     
     async def _create_indexes(self):
         """创建必要的索引"""
-        # 用户行为日志集合索引
-        user_behavior_collection = self._db["user_behavior_log"]
-        await user_behavior_collection.create_index("user_id")
-        await user_behavior_collection.create_index("course_id")
-        await user_behavior_collection.create_index("action_type")
-        await user_behavior_collection.create_index("created_time")
-        await user_behavior_collection.create_index([("user_id", 1), ("course_id", 1)])
+        # 用户行为日志按月分区，分区索引在首次写入时创建（见 services.behavior_log_store）
+        
+        # 用户-课程评分汇总集合索引（$merge 按 user_id + course_id 匹配，需唯一索引）
+        user_course_score_collection = self._db["user_course_score"]
+        await user_course_score_collection.create_index([("user_id", 1), ("course_id", 1)], unique=True)
+        
+        # RAG 评估结果集合索引
+        rag_evaluation_collection = self._db["rag_evaluation"]
+        await rag_evaluation_collection.create_index("created_time")
         
         # 课程评价集合索引
         course_comment_collection = self._db["course_comments"]
@@ -2,26 +2,566 @@
 RabbitMQ异步客户端管理
 """
 import asyncio
+import glob
 import json
-from typing import Callable, Any
+import logging
+import os
+import time
+from typing import Callable, Any, Awaitable
 
 from aio_pika import connect_robust, Message, DeliveryMode
-from aio_pika.abc import AbstractRobustConnection, AbstractChannel, AbstractQueue
+from aio_pika.abc import AbstractRobustConnection, AbstractChannel, AbstractQueue, AbstractIncomingMessage
 
+from core import message_codec
 from core.config import settings
 
+logger = logging.getLogger("api")
+
+
+def build_message(message_body: dict, schema: str | None = None) -> Message:
+    """
+    消息体编码为持久化消息
+    :param schema: 消息类型，已注册字段表且开启二进制编码时使用 msgpack，否则使用 JSON
+    """
+    body, content_type, headers = message_codec.encode(
+        message_body,
+        schema,
+        binary=settings.rabbitmq_message_encoding == "msgpack"
+    )
+    return Message(
+        body=body,
+        content_type=content_type,
+        headers=headers,
+        delivery_mode=DeliveryMode.PERSISTENT  # 消息持久化
+    )
+
+
+def decode_message(message: AbstractIncomingMessage) -> dict:
+    """按消息的 content_type 和消息头解码（兼容 JSON 与 msgpack）"""
+    return message_codec.decode(message.body, message.content_type, message.headers)
+
+
+class PublishBuffer:
+    """
+    异步发布缓冲区
+    调用方只把消息放入内存队列即返回，后台 flusher 按批（batch_size 条或等待 linger_ms）发布：
+    - 通道池：每个 flusher 独占一个开启发布确认的通道，互不争用
+    - 批量确认：一批消息并发发布、统一等待 broker 确认，确认延迟按批摊薄
+    - 有界积压：内存队列满时按溢出策略处理
+        block  等待队列有空位
+        drop   丢弃新消息
+        spill  追加写入本地文件，积压下降后自动回放
+    """
+
+    # 回放溢出文件的检查间隔（秒）
+    REPLAY_INTERVAL = 5.0
+    # 发布失败后的等待时间（秒）
+    RETRY_DELAY = 1.0
+
+    def __init__(
+        self,
+        channels: int,
+        batch_size: int,
+        linger_ms: int,
+        max_backlog: int,
+        overflow: str,
+        spill_dir: str,
+        drain_timeout: float = 5.0
+    ):
+        """
+        :param drain_timeout: 关闭时等待积压发布完成的最长时间（秒）
+        """
+        if overflow not in ("block", "drop", "spill"):
+            raise ValueError(f"不支持的溢出策略: {overflow}")
+        self._channel_count = channels
+        self._batch_size = batch_size
+        self._linger = linger_ms / 1000
+        self._overflow = overflow
+        self._spill_dir = spill_dir
+        self._spill_path = os.path.join(spill_dir, f"spill_{os.getpid()}.jsonl")
+        self._corrupt_path = os.path.join(spill_dir, f"corrupt_{os.getpid()}.jsonl")
+        self._queue: asyncio.Queue[tuple[str, dict]] = asyncio.Queue(maxsize=max_backlog)
+        self._drain_timeout = drain_timeout
+        self._channels: list[AbstractChannel] = []
+        self._tasks: list[asyncio.Task] = []
+        self._replay_tasks: list[asyncio.Task] = []
+        # 已取出、尚未发布完成的批次数
+        self._publishing = 0
+        self._closing = False
+        self._metrics = {"published": 0, "failed": 0, "dropped": 0, "spilled": 0, "replayed": 0}
+
+    async def start(self, connection: AbstractRobustConnection):
+        """创建通道池并启动 flusher"""
+        self._closing = False
+        for _ in range(self._channel_count):
+            channel = await connection.channel(publisher_confirms=True)
+            self._channels.append(channel)
+            self._tasks.append(asyncio.create_task(self._flush_loop(channel)))
+        if self._overflow == "spill":
+            self._replay_tasks.append(asyncio.create_task(self._replay_loop()))
+
+    async def stop(self):
+        """
+        停止发布：不再接收新消息（之后放入的消息直接写入溢出文件），
+        等待 flusher 在超时时间内发布完积压，仍未发布的消息写入溢出文件，下次启动后回放
+        """
+        self._closing = True
+        # 先停止回放，避免继续向队列补充消息
+        for task in self._replay_tasks:
+            task.cancel()
+        await asyncio.gather(*self._replay_tasks, return_exceptions=True)
+        self._replay_tasks = []
+
+        deadline = time.monotonic() + self._drain_timeout
+        while (not self._queue.empty() or self._publishing) and time.monotonic() < deadline:
+            if not any(not task.done() for task in self._tasks):
+                break
+            await asyncio.sleep(0.05)
+
+        # 被取消的 flusher 会把手中的批次写入溢出文件
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        if remaining:
+            await asyncio.to_thread(self._spill, remaining)
+            logger.warning(f"发布缓冲区关闭时仍有 {len(remaining)} 条消息未发布，已写入溢出文件")
+
+        for channel in self._channels:
+            try:
+                await channel.close()
+            except Exception:
+                pass
+        self._channels = []
+
+    async def put(self, queue_name: str, message_body: dict):
+        """放入待发布消息，不等待 broker"""
+        if self._closing:
+            await asyncio.to_thread(self._spill, [(queue_name, message_body)])
+            return
+
+        try:
+            self._queue.put_nowait((queue_name, message_body))
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self._overflow == "block":
+            await self._queue.put((queue_name, message_body))
+        elif self._overflow == "drop":
+            self._metrics["dropped"] += 1
+            logger.warning(f"发布缓冲区已满，丢弃消息: queue={queue_name}")
+        else:
+            await asyncio.to_thread(self._spill, [(queue_name, message_body)])
+
+    def stats(self) -> dict:
+        return {"backlog": self._queue.qsize(), "channels": len(self._channels), **self._metrics}
+
+    async def _flush_loop(self, channel: AbstractChannel):
+        """持续凑批并发布，单批异常只记录日志，不中断 flusher"""
+        while True:
+            batch = [await self._queue.get()]
+            self._publishing += 1
+            try:
+                deadline = time.monotonic() + self._linger
+                while len(batch) < self._batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._publish_batch(channel, batch)
+            except asyncio.CancelledError:
+                # 关闭时手中的批次写入溢出文件（等待确认中的消息可能重复发布，由消费端去重）
+                self._spill(batch)
+                raise
+            except Exception as e:
+                logger.error(f"发布批次处理失败: {len(batch)} 条, {e}")
+                self._metrics["failed"] += len(batch)
+                self._requeue(batch)
+                await asyncio.sleep(self.RETRY_DELAY)
+            finally:
+                self._publishing -= 1
+
+    async def _publish_batch(self, channel: AbstractChannel, batch: list[tuple[str, dict]]):
+        """并发发布一批消息并等待全部确认，失败的消息写入溢出文件或重新入队"""
+        publishable = []
+        messages = []
+        for queue_name, message_body in batch:
+            try:
+                messages.append(build_message(message_body, QUEUE_SCHEMAS.get(queue_name)))
+                publishable.append((queue_name, message_body))
+            except Exception as e:
+                # 无法编码的消息重试也不会成功，直接丢弃
+                self._metrics["dropped"] += 1
+                logger.error(f"消息编码失败，已丢弃: queue={queue_name}, {e}")
+
+        results = await asyncio.gather(*[
+            channel.default_exchange.publish(message, routing_key=queue_name)
+            for (queue_name, _), message in zip(publishable, messages)
+        ], return_exceptions=True)
+
+        failed = [item for item, result in zip(publishable, results) if isinstance(result, BaseException)]
+        self._metrics["published"] += len(publishable) - len(failed)
+        if not failed:
+            return
+
+        self._metrics["failed"] += len(failed)
+        error = next(result for result in results if isinstance(result, BaseException))
+        logger.error(f"批量发布消息失败: {len(failed)}/{len(batch)}, {error}")
+        self._requeue(failed)
+        await asyncio.sleep(self.RETRY_DELAY)
+
+    def _requeue(self, items: list[tuple[str, dict]]):
+        """发布失败的消息写入溢出文件（spill 策略，写入失败时退回内存队列）或重新入队"""
+        if self._overflow == "spill":
+            try:
+                self._spill(items)
+                return
+            except OSError as e:
+                logger.error(f"写入溢出文件失败，消息退回发布队列: {e}")
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self._metrics["dropped"] += 1
+
+    def _spill(self, items: list[tuple[str, dict]]):
+        os.makedirs(self._spill_dir, exist_ok=True)
+        with open(self._spill_path, "a", encoding="utf-8") as f:
+            for queue_name, message_body in items:
+                f.write(json.dumps({"queue": queue_name, "body": message_body}, ensure_ascii=False, default=str))
+                f.write("\n")
+        self._metrics["spilled"] += len(items)
+
+    async def _replay_loop(self):
+        """积压低于一半时回放溢出文件（包括之前进程遗留的文件），单个文件回放失败不中断回放任务"""
+        while True:
+            await asyncio.sleep(self.REPLAY_INTERVAL)
+            if self._queue.qsize() > self._queue.maxsize // 2:
+                continue
+            self._recover_replaying()
+            for path in glob.glob(os.path.join(self._spill_dir, "spill_*.jsonl")):
+                # 先改名再读取，溢出文件只会被一个进程回放，回放期间的新溢出写入新文件
+                replaying_path = f"{path}.{os.getpid()}.replaying"
+                try:
+                    os.rename(path, replaying_path)
+                except OSError:
+                    continue
+                try:
+                    await self._replay(replaying_path)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"回放溢出文件失败，稍后重试: {path}, {e}")
+                    self._restore_spill_file(replaying_path)
+
+    def _recover_replaying(self):
+        """找回回放进程已退出（如回放期间被杀死）遗留的回放中文件，改回溢出文件名重新回放"""
+        for path in glob.glob(os.path.join(self._spill_dir, "spill_*.jsonl.*.replaying")):
+            try:
+                pid = int(path.rsplit(".", 2)[-2])
+            except ValueError:
+                continue
+            # 本进程的回放在本任务内顺序执行，此时没有进行中的回放
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+            self._restore_spill_file(path)
+
+    def _restore_spill_file(self, path: str):
+        """回放中文件改为新的溢出文件名，等待下次回放"""
+        restored_path = os.path.join(self._spill_dir, f"spill_{os.getpid()}_{time.time_ns()}.jsonl")
+        try:
+            os.rename(path, restored_path)
+        except OSError:
+            # 已被其他进程找回或已删除
+            pass
+
+    async def _replay(self, path: str):
+        with open(path, "rb") as f:
+            lines = await asyncio.to_thread(f.readlines)
+
+        items = []
+        corrupt = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                items.append((item["queue"], item["body"]))
+            except (ValueError, KeyError, TypeError):
+                # 如写入溢出文件时进程崩溃留下的不完整行
+                corrupt.append(line.rstrip(b"\n") + b"\n")
+        if corrupt:
+            self._quarantine(corrupt)
+            logger.warning(f"溢出文件中有 {len(corrupt)} 行无法解析，已移入 {self._corrupt_path}: {path}")
+
+        for index, item in enumerate(items):
+            try:
+                # 回放时等待队列空位，不再次溢出
+                await self._queue.put(item)
+            except asyncio.CancelledError:
+                # 关闭时未回放的消息写回溢出文件
+                self._spill(items[index:])
+                os.remove(path)
+                raise
+            self._metrics["replayed"] += 1
+        os.remove(path)
+        logger.info(f"已回放溢出消息: {len(items)} 条")
+
+    def _quarantine(self, lines: list[bytes]):
+        """无法解析的行原样追加到隔离文件（不参与回放），便于人工排查"""
+        with open(self._corrupt_path, "ab") as f:
+            f.writelines(lines)
+
+
+def _process_alive(pid: int) -> bool:
+    """进程是否仍在运行（仅 POSIX 平台可检测，其他平台一律视为运行中）"""
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ConsumerMetrics:
+    """消费者指标（所有 worker 共享）"""
+
+    def __init__(self):
+        self.in_flight = 0  # 已从队列取出、尚未确认的消息数
+        self.processed = 0  # 处理成功的消息数
+        self.failed = 0  # 最终处理失败的消息数（转存死信队列或直接丢弃，不含重新投递）
+        self.dead_lettered = 0  # 转存到死信队列的消息数
+        self.redelivered = 0  # 整批处理失败后重新投递的消息数（同一消息每次重投都计数）
+
+    def to_dict(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dead_lettered": self.dead_lettered,
+            "redelivered": self.redelivered,
+        }
+
+
+class QueueConsumer:
+    """
+    单个队列的消费者
+    启动 workers 个 worker，每个 worker 独占一个通道（独立的 QoS 预取和消息确认），并发消费同一队列；
+    可单独启停，不影响同一连接上的其他消费者
+    """
+
+    # 批量处理整体失败后重新投递前的等待时间（秒），避免依赖故障时空转
+    BATCH_RETRY_DELAY = 1.0
+
+    def __init__(
+        self,
+        connection: AbstractRobustConnection,
+        queue_name: str,
+        callback: Callable,
+        workers: int,
+        prefetch_count: int,
+        dead_letter_queue: str | None = None,
+        batch_size: int | None = None,
+        batch_timeout_ms: int = 0
+    ):
+        """
+        :param callback: 单条模式为 callback(body)；批量模式为 callback(bodies)，返回处理失败的消息下标
+        :param dead_letter_queue: 处理失败的消息转存的队列，None 表示直接丢弃
+        :param batch_size: 每批最大消息数，None 表示逐条处理
+        :param batch_timeout_ms: 凑批最长等待时间（毫秒），从收到本批第一条消息开始计时
+        """
+        self.queue_name = queue_name
+        self.workers = workers
+        self.metrics = ConsumerMetrics()
+        self._connection = connection
+        self._callback = callback
+        # 批量模式下预取量不小于批大小，否则永远凑不满一批
+        self._prefetch_count = max(prefetch_count, batch_size or 0)
+        self._dead_letter_queue = dead_letter_queue
+        self._batch_size = batch_size
+        self._batch_timeout = batch_timeout_ms / 1000
+        self._channels: list[AbstractChannel] = []
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self):
+        """启动全部 worker"""
+        for _ in range(self.workers):
+            channel = await self._connection.channel()
+            await channel.set_qos(prefetch_count=self._prefetch_count)
+            queue = await channel.declare_queue(self.queue_name, durable=True)
+            self._channels.append(channel)
+
+            if self._batch_size:
+                worker = self._consume_batches(channel, queue)
+            else:
+                worker = self._consume(channel, queue)
+            self._tasks.append(asyncio.create_task(worker))
+
+    async def stop(self):
+        """停止全部 worker，未确认的消息由 broker 重新投递"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for channel in self._channels:
+            try:
+                await channel.close()
+            except Exception:
+                pass
+        self._tasks = []
+        self._channels = []
+        self.metrics.in_flight = 0
+
+    def stats(self) -> dict:
+        return {
+            "queue": self.queue_name,
+            "workers": self.workers,
+            "running": self.running,
+            "prefetch_count": self._prefetch_count,
+            "batch_size": self._batch_size,
+            **self.metrics.to_dict(),
+        }
+
+    async def _consume(self, channel: AbstractChannel, queue: AbstractQueue):
+        """逐条消费消息"""
+        async with queue.iterator() as queue_iter:
+            async for message in queue_iter:
+                self.metrics.in_flight += 1
+                try:
+                    try:
+                        await self._callback(decode_message(message))
+                    except Exception as e:
+                        logger.error(f"处理消息失败: queue={self.queue_name}, {e}")
+                        if self._dead_letter_queue:
+                            await self._dead_letter(channel, message)
+                            await message.ack()
+                        else:
+                            await message.reject()
+                        self.metrics.failed += 1
+                    else:
+                        await message.ack()
+                        self.metrics.processed += 1
+                except Exception as e:
+                    # 确认/拒绝失败（如通道关闭、重连）时消息由 broker 重新投递，worker 继续运行
+                    logger.error(f"确认消息失败: queue={self.queue_name}, {e}")
+                finally:
+                    self.metrics.in_flight -= 1
+
+    async def _consume_batches(self, channel: AbstractChannel, queue: AbstractQueue):
+        """持续凑批并处理"""
+        buffer: asyncio.Queue[AbstractIncomingMessage] = asyncio.Queue()
+        await queue.consume(buffer.put)
+
+        while True:
+            batch = [await buffer.get()]
+            deadline = time.monotonic() + self._batch_timeout
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(buffer.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            self.metrics.in_flight += len(batch)
+            try:
+                await self._process_batch(channel, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 确认/拒绝失败（如通道关闭、重连）时未确认的消息由 broker 重新投递，worker 继续运行
+                logger.error(f"批量确认消息失败: queue={self.queue_name}, {e}")
+                await asyncio.sleep(self.BATCH_RETRY_DELAY)
+            finally:
+                self.metrics.in_flight -= len(batch)
+
+    async def _process_batch(self, channel: AbstractChannel, batch: list[AbstractIncomingMessage]):
+        """处理一批消息：解码 -> 批量回调 -> 失败消息转存死信队列 -> 整批确认"""
+        # 无法解码的消息直接进入死信队列
+        decoded: list[AbstractIncomingMessage] = []
+        bodies: list[dict] = []
+        failed: list[AbstractIncomingMessage] = []
+        for message in batch:
+            try:
+                bodies.append(decode_message(message))
+                decoded.append(message)
+            except Exception as e:
+                logger.error(f"消息解码失败: queue={self.queue_name}, {e}")
+                failed.append(message)
+
+        try:
+            if bodies:
+                failed.extend(decoded[index] for index in await self._callback(bodies))
+            if self._dead_letter_queue:
+                for message in failed:
+                    await self._dead_letter(channel, message)
+        except Exception as e:
+            # 重新投递的消息尚无最终结果，不计入失败数（否则每次重投都会重复计数）
+            logger.error(f"批量处理消息失败，整批重新投递: queue={self.queue_name}, {e}")
+            await batch[-1].nack(multiple=True, requeue=True)
+            self.metrics.redelivered += len(batch)
+            await asyncio.sleep(self.BATCH_RETRY_DELAY)
+            return
+
+        # 同一通道上的消息按投递顺序确认，确认最后一条即确认整批
+        await batch[-1].ack(multiple=True)
+        self.metrics.processed += len(batch) - len(failed)
+        self.metrics.failed += len(failed)
+
+    async def _dead_letter(self, channel: AbstractChannel, message: AbstractIncomingMessage):
+        """原样转存消息到死信队列"""
+        await channel.default_exchange.publish(
+            Message(
+                body=message.body,
+                headers=message.headers,
+                content_type=message.content_type,
+                delivery_mode=DeliveryMode.PERSISTENT
+            ),
+            routing_key=self._dead_letter_queue
+        )
+        self.metrics.dead_lettered += 1
+
 
 class RabbitMQClientManager:
     """RabbitMQ连接管理器"""
     
     # 队列名称常量
     USER_BEHAVIOR_LOG_QUEUE = "user_behavior_log_queue"
+    # 死信队列：处理失败的消息转存于此，便于排查和重放
+    USER_BEHAVIOR_LOG_DEAD_LETTER_QUEUE = "user_behavior_log_queue.dead_letter"
+    # RAG 抽样评估队列
+    RAG_EVALUATION_QUEUE = "rag_evaluation_queue"
     
     def __init__(self):
         self._connection: AbstractRobustConnection | None = None
         self._channel: AbstractChannel | None = None
         self._queues: dict[str, AbstractQueue] = {}
-        self._consumer_task: asyncio.Task | None = None
+        self._consumers: dict[str, QueueConsumer] = {}
+        self._publish_buffer = PublishBuffer(
+            channels=settings.rabbitmq_publish_channels,
+            batch_size=settings.rabbitmq_publish_batch_size,
+            linger_ms=settings.rabbitmq_publish_linger_ms,
+            max_backlog=settings.rabbitmq_publish_max_backlog,
+            overflow=settings.rabbitmq_publish_overflow,
+            spill_dir=settings.rabbitmq_publish_spill_dir,
+            drain_timeout=settings.rabbitmq_publish_drain_timeout
+        )
     
     async def init_connection(self):
         """初始化RabbitMQ连接"""
@@ -29,6 +569,8 @@ class RabbitMQClientManager:
         self._channel = await self._connection.channel()
         # 声明队列
         await self._declare_queues()
+        # 启动异步发布缓冲区
+        await self._publish_buffer.start(self._connection)
     
     async def _declare_queues(self):
         """声明所需队列"""
@@ -38,15 +580,24 @@ class RabbitMQClientManager:
             durable=True  # 持久化队列
         )
         self._queues[self.USER_BEHAVIOR_LOG_QUEUE] = queue
+        # 用户行为日志死信队列
+        dead_letter_queue = await self._channel.declare_queue(
+            self.USER_BEHAVIOR_LOG_DEAD_LETTER_QUEUE,
+            durable=True
+        )
+        self._queues[self.USER_BEHAVIOR_LOG_DEAD_LETTER_QUEUE] = dead_letter_queue
+        # RAG 抽样评估队列
+        rag_evaluation_queue = await self._channel.declare_queue(
+            self.RAG_EVALUATION_QUEUE,
+            durable=True
+        )
+        self._queues[self.RAG_EVALUATION_QUEUE] = rag_evaluation_queue
     
     async def close_connection(self):
         """关闭RabbitMQ连接"""
-        if self._consumer_task:
-            self._consumer_task.cancel()
-            try:
-                await self._consumer_task
-            except asyncio.CancelledError:
-                pass
+        for name in list(self._consumers):
+            await self.stop_consumer(name)
+        await self._publish_buffer.stop()
         if self._connection:
             await self._connection.close()
             self._connection = None
@@ -66,37 +617,120 @@ class RabbitMQClientManager:
         :param queue_name: 队列名称
         :param message_body: 消息体（字典）
         """
-        message = Message(
-            body=json.dumps(message_body, ensure_ascii=False, default=str).encode(),
-            delivery_mode=DeliveryMode.PERSISTENT  # 消息持久化
-        )
         await self._channel.default_exchange.publish(
-            message,
+            build_message(message_body, QUEUE_SCHEMAS.get(queue_name)),
             routing_key=queue_name
         )
     
-    async def start_consumer(self, queue_name: str, callback: Callable[[dict], Any]):
+    async def publish_message_buffered(self, queue_name: str, message_body: dict):
+        """
+        发布消息到队列（经发布缓冲区批量发布，不等待 broker 确认即返回）
+        :param queue_name: 队列名称
+        :param message_body: 消息体（字典）
+        """
+        await self._publish_buffer.put(queue_name, message_body)
+    
+    async def publish_messages_buffered(self, queue_name: str, message_bodies: list[dict]):
+        """
+        批量发布消息到队列（经发布缓冲区批量发布，不等待 broker 确认即返回）
+        :param queue_name: 队列名称
+        :param message_bodies: 消息体列表
+        """
+        for message_body in message_bodies:
+            await self._publish_buffer.put(queue_name, message_body)
+    
+    def get_publisher_metrics(self) -> dict:
+        """获取发布缓冲区运行指标"""
+        return self._publish_buffer.stats()
+    
+    async def start_consumer(
+        self,
+        queue_name: str,
+        callback: Callable[[dict], Any],
+        workers: int | None = None,
+        prefetch_count: int | None = None,
+        dead_letter_queue: str | None = None,
+        name: str | None = None
+    ) -> QueueConsumer:
         """
-        启动消费者
+        启动消费者（逐条处理）
         :param queue_name: 队列名称
         :param callback: 消息处理回调函数
+        :param workers: 并发 worker 数，默认取配置
+        :param prefetch_count: 每个 worker 的预取消息数，默认取配置
+        :param dead_letter_queue: 处理失败的消息转存的队列，None 表示直接丢弃
+        :param name: 消费者名称，默认为队列名称
+        """
+        return await self._start(QueueConsumer(
+            self._connection,
+            self._get_queue_name(queue_name),
+            callback,
+            workers=workers or settings.rabbitmq_consumer_workers,
+            prefetch_count=prefetch_count or settings.rabbitmq_prefetch_count,
+            dead_letter_queue=dead_letter_queue
+        ), name or queue_name)
+    
+    async def start_batch_consumer(
+        self,
+        queue_name: str,
+        callback: Callable[[list[dict]], Awaitable[list[int]]],
+        dead_letter_queue: str,
+        batch_size: int,
+        batch_timeout_ms: int,
+        workers: int | None = None,
+        prefetch_count: int | None = None,
+        name: str | None = None
+    ) -> QueueConsumer:
+        """
+        启动批量消费者：累计到 batch_size 条或等待 batch_timeout_ms 后整批处理，
+        处理完成后一次性确认整批消息（multiple ack）
+        :param queue_name: 队列名称
+        :param callback: 批量处理回调，返回处理失败的消息下标，这些消息被转存到死信队列；
+                         抛出异常表示整批失败，整批重新投递
+        :param dead_letter_queue: 死信队列名称
+        :param batch_size: 每批最大消息数
+        :param batch_timeout_ms: 凑批最长等待时间（毫秒），从收到本批第一条消息开始计时
+        :param workers: 并发 worker 数，默认取配置
+        :param prefetch_count: 每个 worker 的预取消息数（不小于 batch_size），默认取配置
+        :param name: 消费者名称，默认为队列名称
         """
-        queue = self._queues.get(queue_name)
-        if not queue:
+        return await self._start(QueueConsumer(
+            self._connection,
+            self._get_queue_name(queue_name),
+            callback,
+            workers=workers or settings.rabbitmq_consumer_workers,
+            prefetch_count=prefetch_count or settings.rabbitmq_prefetch_count,
+            dead_letter_queue=dead_letter_queue,
+            batch_size=batch_size,
+            batch_timeout_ms=batch_timeout_ms
+        ), name or queue_name)
+    
+    async def stop_consumer(self, name: str):
+        """停止指定消费者"""
+        consumer = self._consumers.pop(name, None)
+        if consumer:
+            await consumer.stop()
+    
+    def get_consumer_metrics(self) -> dict[str, dict]:
+        """获取全部消费者的运行指标"""
+        return {name: consumer.stats() for name, consumer in self._consumers.items()}
+    
+    def _get_queue_name(self, queue_name: str) -> str:
+        if queue_name not in self._queues:
             raise ValueError(f"Queue {queue_name} not found")
-        
-        async def process_message(message):
-            async with message.process():
-                body = json.loads(message.body.decode())
-                await callback(body)
-        
-        self._consumer_task = asyncio.create_task(self._consume(queue, process_message))
-    
-    async def _consume(self, queue: AbstractQueue, callback: Callable):
-        """持续消费消息"""
-        async with queue.iterator() as queue_iter:
-            async for message in queue_iter:
-                await callback(message)
+        return queue_name
+    
+    async def _start(self, consumer: QueueConsumer, name: str) -> QueueConsumer:
+        if name in self._consumers:
+            raise ValueError(f"Consumer {name} already started")
+        await consumer.start()
+        self._consumers[name] = consumer
+        return consumer
+
 
+# 队列 -> 消息类型（决定二进制编码使用的字段表）
+QUEUE_SCHEMAS = {
+    RabbitMQClientManager.USER_BEHAVIOR_LOG_QUEUE: "user_behavior_log",
+}
 
 rabbitmq_client_manager = RabbitMQClientManager()
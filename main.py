@@ -1,3 +1,5 @@
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -5,6 +7,7 @@ from starlette.middleware.cors import CORSMiddleware
 from tortoise.contrib.fastapi import register_tortoise
 
 from api.router import api_router
+from core.compute_pool import compute_pool
 from core.config import settings
 from core.mongodb_client import mongodb_client_manager
 from core.rabbitmq_client import rabbitmq_client_manager
@@ -13,19 +16,69 @@ from middleware.authentication import register_authentication_middleware
 from middleware.exception import register_exception_middleware
 from middleware.logging import register_access_log_middleware
 from services.behavior_consumer import start_behavior_log_consumer
+from services.answer_cache import semantic_answer_cache
+from services.behavior_log_store import behavior_log_store
+from services.course_card import course_card_service
+from services.hot_course_leaderboard import hot_course_leaderboard
+from services.rag_evaluation import start_rag_evaluation_consumer
+from services.user_course_score import user_course_score_rollup
+from services.recommender_factory import RecommenderFactory
+
+logger = logging.getLogger("api")
+
+
+async def start_behavior_pipeline():
+    """
+    用户-课程评分汇总就绪后再启动行为日志消费者和推荐模型构建：
+    首次部署的回填在后台执行，不阻塞服务启动；回填期间消费者的增量不会被覆盖，模型也不会读到未填满的汇总
+    """
+    try:
+        await user_course_score_rollup.wait_until_ready(behavior_log_store)
+        # 启动用户行为日志消费者
+        await start_behavior_log_consumer()
+        # 加载已启用算法的推荐模型并启动定时重建
+        for recommender in RecommenderFactory.active_recommenders():
+            await recommender.model_manager.start()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"启动行为日志处理失败: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 衰减参数会导致评分浮点溢出时拒绝启动
+    user_course_score_rollup.validate_decay()
     # 启动时初始化 Redis 连接池
     await redis_client_manager.init_pool()
     # 初始化 MongoDB 连接
     await mongodb_client_manager.init_client()
     # 初始化 RabbitMQ 连接
     await rabbitmq_client_manager.init_connection()
-    # 启动用户行为日志消费者
-    await start_behavior_log_consumer()
+    # 订阅课程卡片缓存失效通知
+    await course_card_service.start_listener()
+    # 热门课程排行榜为空时从行为日志回放
+    await hot_course_leaderboard.seed_from_history(behavior_log_store)
+    # 用户-课程评分汇总就绪（必要时后台回填）后启动行为日志消费者和推荐模型
+    behavior_pipeline_task = asyncio.create_task(start_behavior_pipeline())
+    # 启动 RAG 抽样评估消费者
+    await start_rag_evaluation_consumer()
+    # 定时归档超过保留期的行为日志分区
+    await behavior_log_store.start_archiver()
+    # 定时清理过期的语义答案缓存
+    await semantic_answer_cache.start_cleaner()
     yield
+    behavior_pipeline_task.cancel()
+    try:
+        await behavior_pipeline_task
+    except asyncio.CancelledError:
+        pass
+    for recommender in RecommenderFactory.active_recommenders():
+        await recommender.model_manager.stop()
+    compute_pool.shutdown()
+    await behavior_log_store.stop_archiver()
+    await semantic_answer_cache.stop_cleaner()
+    await course_card_service.stop_listener()
     # 关闭时释放连接
     await rabbitmq_client_manager.close_connection()
     await mongodb_client_manager.close_client()
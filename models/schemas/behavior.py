@@ -1,6 +1,7 @@
 """
 用户行为日志模型（MongoDB Document）
 """
+import uuid
 from datetime import datetime
 from enum import Enum
 from typing import Optional, Any
@@ -32,6 +33,7 @@ class UserBehaviorLog(BaseModel):
     created_time: datetime = Field(default_factory=datetime.now, description="行为发生时间")
     ip_address: Optional[str] = Field(None, description="用户IP地址")
     user_agent: Optional[str] = Field(None, description="用户代理")
+    log_id: str = Field(default_factory=lambda: uuid.uuid4().hex, description="日志ID（发布时生成，消费者作为 _id 幂等写入）")
     
     class Config:
         use_enum_values = True
@@ -45,6 +47,11 @@ class UserBehaviorLogRequest(BaseModel):
     extra_info: Optional[dict[str, Any]] = Field(default_factory=dict, description="扩展信息")
 
 
+class UserBehaviorLogBatchRequest(BaseModel):
+    """用户行为日志批量请求模型"""
+    items: list[UserBehaviorLogRequest] = Field(..., min_length=1, max_length=100, description="行为列表")
+
+
 class UserBehaviorLogResponse(BaseModel):
     """用户行为日志响应模型"""
     id: str = Field(..., description="日志ID")
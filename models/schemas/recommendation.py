@@ -1,6 +1,8 @@
 """
 推荐系统API
 """
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -8,6 +10,7 @@ class RecommendationRequest(BaseModel):
     """推荐请求"""
     top_n: int = Field(10, ge=1, le=50, description="推荐数量")
     exclude_interacted: bool = Field(True, description="是否排除已交互课程")
+    algorithm: Optional[str] = Field(None, description="推荐算法（item_cf / als），默认使用配置的算法")
 
 
 class RecommendationItem(BaseModel):
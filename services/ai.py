@@ -1,13 +1,28 @@
+import asyncio
 import json
+from functools import partial
 from typing import List
 
 from langchain_core.documents import Document
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
-from core.ai import llm, vector_store
+from core.ai import embeddings, llm, retrieval_executor, vector_store
+from core.config import settings
+from services.answer_cache import semantic_answer_cache
+from services.rag_evaluation import submit_rag_evaluation
 
 
 class AiService:
+    # 回放缓存答案时每个 SSE 事件的字符数
+    REPLAY_CHUNK_SIZE = 20
+    # 指代词：出现时需要结合历史改写问题
+    REFERENCE_WORDS = (
+        "它", "他", "她", "这", "那", "其", "该", "此", "上述", "上面", "前面", "刚才", "之前",
+    )
+    # 省略句：以这些词开头（如"还有别的药吗"）或长度很短（如"儿童呢"）
+    ELLIPSIS_PREFIXES = ("还有", "另外", "和", "跟")
+    ELLIPSIS_MAX_LENGTH = 6
+
     async def chat(self, user_id: int, question: str, session_id: str):
         """
         AI 聊天接口 (融合三种 RAG 策略)
@@ -29,32 +44,31 @@ class AiService:
                 history_messages.append(AIMessage(content=msg['content']))
 
         # ==================================================
-        # 2. 【策略一：历史上下文重写】 (History Awareness)
-        # 目的：处理指代消解 (如 "它怎么治" -> "甲流怎么治")
+        # 1.5 【语义答案缓存】首轮问题命中相似问题的历史答案时直接回放
         # ==================================================
-        standalone_question = await self.rewrite_query_based_on_history(question, history_messages)
-        print(f"🧐 [策略1] 独立问题: {standalone_question}")
+        if not history_messages:
+            cached_answer = await semantic_answer_cache.lookup(question)
+            if cached_answer is not None:
+                print("⚡ [缓存] 命中语义答案缓存")
+                for i in range(0, len(cached_answer), self.REPLAY_CHUNK_SIZE):
+                    yield f'data: {cached_answer[i:i + self.REPLAY_CHUNK_SIZE]}\n\n'
+                await self._save_history(redis_client, user_id, session_id, question, cached_answer)
+                return
 
         # ==================================================
-        # 3. 【策略二 & 三：多路扩展与分解】 (Expansion & Decomposition)
-        # 目的：生成多个搜索视角和子问题
+        # 2 & 3. 【检索规划】历史上下文重写 + 多路扩展与分解，合并为至多一次 LLM 调用
+        # 目的：处理指代消解 (如 "它怎么治" -> "甲流怎么治")，并生成多个搜索视角和子问题
+        # (如 ["甲流治疗方案", "儿童甲流用药", "甲流发烧护理"])
         # ==================================================
-        # 这一步会生成一个列表，例如 ["甲流治疗方案", "儿童甲流用药", "甲流发烧护理"]
-        queries_to_search = await self.generate_multi_queries(standalone_question)
+        standalone_question, queries_to_search = await self.plan_queries(question, history_messages)
+        print(f"🧐 [策略1] 独立问题: {standalone_question}")
         print(f"🚀 [策略2&3] 生成的搜索词: {queries_to_search}")
 
         # ==================================================
         # 4. 【并行向量检索 & 去重】 (Retrieval & Deduplication)
         # 目的：拿着所有搜索词去库里找，并合并结果
         # ==================================================
-        all_docs = []
-
-        # 遍历所有生成的查询词进行检索
-        # 注意：vector_store.similarity_search 是同步的，这里用循环
-        for q in queries_to_search:
-            # 这里的 k=2 可以小一点，因为我们搜了很多次，总量会很多
-            docs = vector_store.similarity_search(q, k=2)
-            all_docs.extend(docs)
+        all_docs = await self.retrieve_documents(queries_to_search)
 
         # 【文档去重】：根据 page_content 去重，防止上下文重复
         unique_docs = self._deduplicate_documents(all_docs)
@@ -62,9 +76,6 @@ class AiService:
 
         # 构建上下文
         context_text = "\n\n".join([doc.page_content for doc in unique_docs])
-        response = await llm.ainvoke(
-            [{'role': 'user', 'content': f'帮我评估一下召回率:用户的问题{question},RAG检索结果:{context_text}'}])
-        print(f'🤖 LLM RAG评估回复:{response.content}')
         # ==================================================
         # 5. 生成最终回答
         # ==================================================
@@ -98,24 +109,86 @@ class AiService:
         # ==================================================
         # 6. 存入历史记录
         # ==================================================
-        new_history = [
-            {'role': 'user', 'content': question},
-            {"role": "assistant", "content": final_answer}
-        ]
-        await redis_client.rpush(chat_message_list_key, *[json.dumps(m) for m in new_history])
+        await self._save_history(redis_client, user_id, session_id, question, final_answer)
+        if not history_messages and unique_docs:
+            await semantic_answer_cache.store(question, final_answer)
 
-        chat_message_hash_key = f'chat:message:hash:{user_id}:{session_id}'
-        await redis_client.hset(chat_message_hash_key, mapping={
-            "last_message": final_answer[:20]
-        })
+        # ==================================================
+        # 7. 抽样提交 RAG 质量评估（后台消费者异步评估，不影响对话延迟）
+        # ==================================================
+        await submit_rag_evaluation(
+            user_id, session_id, question, standalone_question, queries_to_search,
+            [doc.page_content for doc in unique_docs], final_answer
+        )
 
     # -------------------------------------------------------------------------
     # 辅助方法区域
     # -------------------------------------------------------------------------
 
+    def needs_rewrite(self, question: str, history_messages) -> bool:
+        """
+        判断问题是否需要结合历史改写：没有历史，或问题中没有指代词且不是省略句时直接使用原问题
+        """
+        if not history_messages:
+            return False
+        if len(question.strip()) <= self.ELLIPSIS_MAX_LENGTH:
+            return True
+        if question.strip().startswith(self.ELLIPSIS_PREFIXES):
+            return True
+        return any(word in question for word in self.REFERENCE_WORDS)
+
+    async def plan_queries(self, question: str, history_messages) -> tuple[str, List[str]]:
+        """
+        【策略一 + 策略二 & 三】检索规划
+        - 不需要改写的问题（见 needs_rewrite）只做多路扩展
+        - 需要改写的问题一次 LLM 调用同时输出独立问题和检索词（JSON）
+        :return: (独立问题, 检索词列表)
+        """
+        if not self.needs_rewrite(question, history_messages):
+            return question, await self.generate_multi_queries(question)
+
+        prompt = """
+        你是一个搜索优化专家。请根据【对话历史】和【用户的最新问题】完成两件事：
+        1. 将用户的问题重写为一个**独立的、语义完整的**句子。
+           例如：将"它有什么副作用"重写为"奥司他韦有什么副作用"。
+        2. 基于重写后的问题生成 3 个不同的搜索查询词：
+           - **同义扩展**：包含相关的医学术语或别名（如"发烧"->"发热处理"）。
+           - **问题拆解**：如果问题复杂，拆解为子问题（如"甲流乙流区别"->"甲流症状"和"乙流症状"）。
+           - **保留原意**：必须包含问题的核心查询，禁止修改用户原本的意思。
+
+        只输出 JSON，不要解释，格式：
+        {"standalone_question": "重写后的问题", "queries": ["查询词1", "查询词2", "查询词3"]}
+        """
+
+        messages = [
+            SystemMessage(content=prompt),
+            HumanMessage(content=f"【对话历史】: {history_messages}\n【用户最新的问题】: {question}")
+        ]
+
+        response = await llm.ainvoke(messages)
+        try:
+            content = response.content.strip()
+            if content.startswith("```"):
+                content = content.strip("`").removeprefix("json").strip()
+            plan = json.loads(content)
+            standalone_question = str(plan.get("standalone_question") or "").strip()
+            queries = plan.get("queries")
+        except (ValueError, AttributeError):
+            standalone_question, queries = "", None
+
+        # 兜底：没有得到改写结果时单独改写（指代未消解的原问题检索不到相关内容）
+        if not standalone_question:
+            standalone_question = await self.rewrite_query_based_on_history(question, history_messages)
+        # 检索词必须是列表，模型返回字符串等其他格式时单独扩展
+        if not isinstance(queries, list):
+            return standalone_question, await self.generate_multi_queries(standalone_question)
+
+        queries = [str(q).strip() for q in queries if str(q).strip()]
+        return standalone_question, self._merge_queries(standalone_question, queries)
+
     async def rewrite_query_based_on_history(self, question, history_messages) -> str:
         """
-        【策略一实现】：基于历史记录重写问题
+        【策略一实现】：基于历史记录重写问题（检索规划结果不可用时的兜底）
         """
         if not history_messages:
             return question
@@ -134,7 +207,7 @@ class AiService:
 
         # 使用 ainvoke 异步调用
         response = await llm.ainvoke(messages)
-        return response.content.strip()
+        return response.content.strip() or question
 
     async def generate_multi_queries(self, original_query: str) -> List[str]:
         """
@@ -164,6 +237,10 @@ class AiService:
         # 解析结果，按行分割
         queries = [q.strip() for q in content.split('\n') if q.strip()]
 
+        return self._merge_queries(original_query, queries)
+
+    def _merge_queries(self, original_query: str, queries: List[str]) -> List[str]:
+        """合并原问题与生成的检索词"""
         # 兜底：如果生成失败，至少保留原问题
         if not queries:
             return [original_query]
@@ -174,6 +251,40 @@ class AiService:
 
         return queries[:4]  # 限制最多搜 4 次，防止太慢
 
+    async def retrieve_documents(self, queries: List[str], k: int | None = None) -> List[Document]:
+        """
+        多路向量检索：所有检索词一次批量向量化（命中缓存的跳过），再并发检索
+        向量化和 PGVector 查询都是同步调用，放到检索线程池执行，检索耗时取决于最慢的一路而不是总和
+        :param queries: 检索词列表
+        :param k: 每个检索词召回的片段数
+        :return: 按检索词顺序拼接的片段（未去重）
+        """
+        if not queries:
+            return []
+        k = k or settings.rag_retrieval_k
+        loop = asyncio.get_running_loop()
+
+        vectors = await loop.run_in_executor(retrieval_executor, embeddings.embed_queries, queries)
+        results = await asyncio.gather(*[
+            loop.run_in_executor(retrieval_executor, partial(vector_store.similarity_search_by_vector, vector, k=k))
+            for vector in vectors
+        ])
+        return [doc for docs in results for doc in docs]
+
+    async def _save_history(self, redis_client, user_id: int, session_id: str, question: str, answer: str):
+        """存入会话历史并更新会话的最后一条消息"""
+        chat_message_list_key = f'chat:message:list:{user_id}:{session_id}'
+        new_history = [
+            {'role': 'user', 'content': question},
+            {"role": "assistant", "content": answer}
+        ]
+        await redis_client.rpush(chat_message_list_key, *[json.dumps(m) for m in new_history])
+
+        chat_message_hash_key = f'chat:message:hash:{user_id}:{session_id}'
+        await redis_client.hset(chat_message_hash_key, mapping={
+            "last_message": answer[:20]
+        })
+
     def _deduplicate_documents(self, documents: List[Document]) -> List[Document]:
         """
         文档去重工具：根据 page_content 去重
@@ -0,0 +1,201 @@
+"""
+语义答案缓存
+热门问题（如"甲流怎么治"）每次都要经过问题改写、多路扩展、向量检索和最终生成，
+这里按问题向量相似度复用历史答案：
+- 答案连同问题向量存入独立的 PGVector 集合，元数据记录知识库版本和生成时间
+- 只匹配当前知识库版本、有效期内且余弦相似度不低于阈值的答案
+- 只缓存没有对话历史的首轮问题：带历史的回答依赖上下文，不能在用户间共享
+命中数、未命中数记录在 Redis，单条答案的命中次数按问题摘要记录在有序集合中（不保存问题原文），便于分析头部问题。
+过期、旧知识库版本的答案查找时不再命中，由后台任务定期删除，超出数量上限时删除最早的答案，控制全量扫描的行数。
+"""
+import asyncio
+import hashlib
+import logging
+import time
+
+from langchain_core.documents import Document
+from sqlalchemy import Float, delete, func, or_, select
+
+from core.ai import answer_cache_store, embeddings, retrieval_executor
+from core.config import settings
+from core.redis_client import redis_client_manager
+
+logger = logging.getLogger("api")
+
+
+class SemanticAnswerCache:
+    """语义答案缓存"""
+
+    STATS_KEY = "ai:answer_cache:stats"
+    HITS_KEY = "ai:answer_cache:hits"
+    CLEANUP_LOCK_KEY = "ai:answer_cache:cleanup_lock"
+
+    def __init__(self):
+        self._cleanup_task: asyncio.Task | None = None
+
+    async def lookup(self, question: str) -> str | None:
+        """
+        查找相似问题的缓存答案
+        :return: 缓存答案，未命中或缓存不可用时返回 None
+        """
+        if not settings.answer_cache_enabled:
+            return None
+
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(retrieval_executor, self._search, question)
+        except Exception as e:
+            logger.error(f"查询语义答案缓存失败: {e}")
+            return None
+
+        # PGVector 默认返回余弦距离
+        hit = None
+        if results:
+            doc, distance = results[0]
+            if 1 - distance >= settings.answer_cache_similarity:
+                hit = doc
+
+        await self._record(hit)
+        return hit.metadata["answer"] if hit else None
+
+    def _search(self, question: str) -> list[tuple[Document, float]]:
+        cutoff = time.time() - settings.answer_cache_ttl_days * 60 * 60 * 24
+        return answer_cache_store.similarity_search_with_score_by_vector(
+            embeddings.embed_query(question),
+            k=1,
+            filter={
+                "kb_version": {"$eq": settings.knowledge_base_version},
+                "created_at": {"$gte": cutoff},
+            }
+        )
+
+    async def store(self, question: str, answer: str):
+        """缓存问题的答案（失败不影响对话）"""
+        if not settings.answer_cache_enabled or not answer:
+            return
+
+        metadata = {
+            "answer": answer,
+            "kb_version": settings.knowledge_base_version,
+            "created_at": time.time(),
+        }
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(retrieval_executor, self._add, question, metadata)
+        except Exception as e:
+            logger.error(f"写入语义答案缓存失败: {e}")
+
+    @staticmethod
+    def _add(question: str, metadata: dict):
+        # 与查找一致使用查询向量（add_documents 会按文档类型向量化，与查询向量不在同一空间）
+        answer_cache_store.add_embeddings(
+            texts=[question],
+            embeddings=[embeddings.embed_query(question)],
+            metadatas=[metadata]
+        )
+
+    @staticmethod
+    def question_hash(question: str) -> str:
+        """问题摘要（命中统计不保存用户问题原文）"""
+        return hashlib.sha1(question.encode("utf-8")).hexdigest()[:16]
+
+    async def _record(self, hit: Document | None):
+        try:
+            redis = redis_client_manager.get_client()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hincrby(self.STATS_KEY, "hits" if hit else "misses", 1)
+                if hit:
+                    pipe.zincrby(self.HITS_KEY, 1, self.question_hash(hit.page_content))
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"记录语义答案缓存命中失败: {e}")
+
+    async def stats(self, top_n: int = 10) -> dict:
+        """
+        缓存命中指标
+        :param top_n: 返回命中次数最多的问题摘要数
+        """
+        redis = redis_client_manager.get_client()
+        counters = await redis.hgetall(self.STATS_KEY)
+        hits, misses = int(counters.get("hits", 0)), int(counters.get("misses", 0))
+        top_questions = await redis.zrevrange(self.HITS_KEY, 0, top_n - 1, withscores=True)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "top_questions": [{"question_hash": digest, "hits": int(score)} for digest, score in top_questions],
+        }
+
+    async def cleanup(self):
+        """删除过期、旧知识库版本的缓存答案，超出数量上限时删除最早的答案（多进程时只由一个进程执行）"""
+        redis = redis_client_manager.get_client()
+        lock = redis.lock(self.CLEANUP_LOCK_KEY, timeout=60 * 10, blocking_timeout=0)
+        if not await lock.acquire(blocking=False):
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+            deleted = await loop.run_in_executor(retrieval_executor, self._delete_stale)
+            # 命中统计只保留命中次数最多的问题摘要
+            await redis.zremrangebyrank(self.HITS_KEY, 0, -settings.answer_cache_max_entries - 1)
+            if deleted:
+                logger.info(f"语义答案缓存已清理: {deleted} 条")
+        finally:
+            try:
+                await lock.release()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _delete_stale() -> int:
+        embedding_store = answer_cache_store.EmbeddingStore
+        created_at = func.coalesce(embedding_store.cmetadata["created_at"].astext.cast(Float), 0)
+        cutoff = time.time() - settings.answer_cache_ttl_days * 60 * 60 * 24
+
+        with answer_cache_store.session_maker() as session:
+            collection = answer_cache_store.get_collection(session)
+            if collection is None:
+                return 0
+            in_collection = embedding_store.collection_id == collection.uuid
+
+            deleted = session.execute(delete(embedding_store).where(in_collection, or_(
+                embedding_store.cmetadata["kb_version"].astext.is_distinct_from(settings.knowledge_base_version),
+                created_at < cutoff
+            ))).rowcount
+            newest = (
+                select(embedding_store.id)
+                .where(in_collection)
+                .order_by(created_at.desc())
+                .limit(settings.answer_cache_max_entries)
+            )
+            deleted += session.execute(
+                delete(embedding_store).where(in_collection, embedding_store.id.not_in(newest))
+            ).rowcount
+            session.commit()
+        return deleted
+
+    async def start_cleaner(self):
+        """启动定时清理（未开启缓存时不启动）"""
+        if settings.answer_cache_enabled and self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop_cleaner(self):
+        """停止定时清理"""
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                logger.error(f"清理语义答案缓存失败: {e}")
+            await asyncio.sleep(settings.answer_cache_cleanup_interval)
+
+
+semantic_answer_cache = SemanticAnswerCache()
@@ -1,43 +1,102 @@
 """
 用户行为日志消费者 - 从RabbitMQ消费消息并写入MongoDB
 """
+import hashlib
+import json
 import logging
 from datetime import datetime
 
-from core.mongodb_client import mongodb_client_manager
+from core.config import settings
 from core.rabbitmq_client import rabbitmq_client_manager, RabbitMQClientManager
+from services.behavior_log_store import behavior_log_store
+from services.hot_course_leaderboard import hot_course_leaderboard
+from services.recommendation_cache import recommendation_result_cache
+from services.recommender_factory import RecommenderFactory
+from services.user_course_score import user_course_score_rollup
+from services.user_profile_cache import user_profile_cache
 
 logger = logging.getLogger("api")
 
-# MongoDB集合名称
-USER_BEHAVIOR_COLLECTION = "user_behavior_log"
+
+async def process_behavior_logs(messages: list[dict]) -> list[int]:
+    """
+    批量处理用户行为日志消息
+    :param messages: 消息体列表
+    :return: 写入失败的消息下标（由消费者转存到死信队列）
+    """
+    # 添加写入时间；发布时生成的日志ID作为 _id，消息重投时重复写入会因唯一键冲突被跳过
+    inserted_time = datetime.now()
+    for message in messages:
+        message["_id"] = message.pop("log_id", None) or _fallback_log_id(message)
+        message["inserted_time"] = inserted_time
+    
+    # 按月分区无序批量写入MongoDB，单条失败不影响其余文档
+    # 非单条文档错误（如写关注失败）无法确定哪些文档已写入，异常抛出后整批重试
+    failed, duplicates = await behavior_log_store.insert_many(messages)
+    if failed:
+        logger.error(f"用户行为日志部分写入失败: {len(failed)}/{len(messages)}")
+    if duplicates:
+        logger.info(f"用户行为日志重复投递已跳过: {len(duplicates)} 条")
+    
+    # 已写入过的日志视为处理成功，不再重复累加推荐相关状态
+    failed_indexes = set(failed)
+    skipped_indexes = failed_indexes | set(duplicates)
+    inserted = [message for index, message in enumerate(messages) if index not in skipped_indexes]
+    logger.info(f"用户行为日志已批量写入MongoDB: {len(inserted)} 条")
+    
+    if inserted:
+        await _update_recommendation_state(inserted)
+    
+    return failed
+
+
+def _fallback_log_id(message: dict) -> str:
+    """未携带日志ID的旧消息按内容生成确定的ID，重投时保持一致"""
+    return hashlib.sha1(json.dumps(message, sort_keys=True, default=str).encode()).hexdigest()
 
 
-async def process_behavior_log(message: dict):
+async def _update_recommendation_state(logs: list[dict]):
     """
-    处理用户行为日志消息
-    :param message: 消息体
+    根据已写入的行为日志批量更新推荐相关状态
+    失败不影响日志写入，避免消息重投导致重复写入
     """
+    # 累加用户-课程衰减评分汇总（失败时可通过回填任务修复）
     try:
-        # 添加写入时间
-        message["inserted_time"] = datetime.now()
-        
-        # 写入MongoDB
-        collection = mongodb_client_manager.get_collection(USER_BEHAVIOR_COLLECTION)
-        result = await collection.insert_one(message)
-        
-        logger.info(f"用户行为日志已写入MongoDB: {result.inserted_id}")
+        await user_course_score_rollup.record(logs)
     except Exception as e:
-        logger.error(f"写入用户行为日志失败: {e}")
-        raise
+        logger.error(f"更新用户-课程评分汇总失败: {e}")
+    
+    # 按课程、用户合并权重后批量更新热门课程排行榜、用户画像，并失效推荐结果缓存
+    course_weights: dict[int, float] = {}
+    user_course_weights: dict[int, dict[int, float]] = {}
+    for log in logs:
+        weight = log.get("action_value") or 0.0
+        course_weights[log["course_id"]] = course_weights.get(log["course_id"], 0.0) + weight
+        user_courses = user_course_weights.setdefault(log["user_id"], {})
+        user_courses[log["course_id"]] = user_courses.get(log["course_id"], 0.0) + weight
+    try:
+        await hot_course_leaderboard.record(course_weights)
+        await user_profile_cache.record(user_course_weights)
+        await recommendation_result_cache.invalidate_users(list(user_course_weights))
+    except Exception as e:
+        logger.error(f"更新推荐相关缓存失败: {e}")
+    
+    # 累计新行为，达到阈值后触发推荐模型重建
+    for recommender in RecommenderFactory.active_recommenders():
+        recommender.model_manager.record_events(len(logs))
 
 
 async def start_behavior_log_consumer():
-    """启动用户行为日志消费者"""
+    """启动用户行为日志消费者（批量写入）"""
     try:
-        await rabbitmq_client_manager.start_consumer(
+        await rabbitmq_client_manager.start_batch_consumer(
             RabbitMQClientManager.USER_BEHAVIOR_LOG_QUEUE,
-            process_behavior_log
+            process_behavior_logs,
+            dead_letter_queue=RabbitMQClientManager.USER_BEHAVIOR_LOG_DEAD_LETTER_QUEUE,
+            batch_size=settings.behavior_consumer_batch_size,
+            batch_timeout_ms=settings.behavior_consumer_batch_timeout_ms,
+            workers=settings.behavior_consumer_workers,
+            prefetch_count=settings.behavior_consumer_prefetch_count
         )
         logger.info("用户行为日志消费者已启动")
     except Exception as e:
@@ -45,17 +104,33 @@ async def start_behavior_log_consumer():
         raise
 
 
+async def publish_behavior_logs(logs: list[dict]):
+    """
+    批量发布用户行为日志到RabbitMQ
+    :param logs: 日志数据列表
+    """
+    try:
+        await rabbitmq_client_manager.publish_messages_buffered(
+            RabbitMQClientManager.USER_BEHAVIOR_LOG_QUEUE,
+            logs
+        )
+        logger.debug(f"用户行为日志已批量放入发布缓冲区: count={len(logs)}")
+    except Exception as e:
+        logger.error(f"批量发布用户行为日志失败: {e}")
+        raise
+
+
 async def publish_behavior_log(log_data: dict):
     """
     发布用户行为日志到RabbitMQ
     :param log_data: 日志数据
     """
     try:
-        await rabbitmq_client_manager.publish_message(
+        await rabbitmq_client_manager.publish_message_buffered(
             RabbitMQClientManager.USER_BEHAVIOR_LOG_QUEUE,
             log_data
         )
-        logger.debug(f"用户行为日志已发布到队列: user_id={log_data.get('user_id')}, action={log_data.get('action_type')}")
+        logger.debug(f"用户行为日志已放入发布缓冲区: user_id={log_data.get('user_id')}, action={log_data.get('action_type')}")
     except Exception as e:
         logger.error(f"发布用户行为日志失败: {e}")
         raise
@@ -0,0 +1,348 @@
+"""
+用户行为日志按月分区存储
+- 行为日志按写入时间写入月分区集合 user_behavior_log_YYYYMM，每个分区只建少量索引，写放大与索引大小不随总量增长
+- 跨分区读取通过 $unionWith 拼接，过滤条件下推到每个分区
+- 超过保留期的分区整体导出为 JSONL.gz 归档文件后删除（推荐器依赖的用户-课程评分汇总不受影响）
+分区之前的历史数据保存在未分区的 user_behavior_log 集合中，读取时一并包含；
+升级后执行一次迁移，按写入时间逐月归档或移入月分区，完成后删除该集合（连同其旧索引）：
+    python -m services.behavior_log_store --migrate-legacy
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+from redis.exceptions import LockError
+
+from core.config import settings
+from core.mongodb_client import mongodb_client_manager
+from core.redis_client import redis_client_manager
+
+logger = logging.getLogger("api")
+
+# 分区集合名前缀（同时也是分区前的历史集合名）
+USER_BEHAVIOR_COLLECTION = "user_behavior_log"
+
+# MongoDB 唯一键冲突错误码
+DUPLICATE_KEY_ERROR = 11000
+
+PARTITION_PATTERN = re.compile(rf"^{USER_BEHAVIOR_COLLECTION}_(\d{{4}})(\d{{2}})$")
+
+
+class BehaviorLogStore:
+    """用户行为日志分区存储"""
+
+    ARCHIVE_LOCK_KEY = "behavior_log:archive_lock"
+    ARCHIVE_LOCK_TIMEOUT = 60 * 60
+    # 归档时每次写入文件的文档数
+    ARCHIVE_CHUNK_SIZE = 5000
+
+    def __init__(self):
+        # 已确认创建索引的分区
+        self._ready_partitions: set[str] = set()
+        self._archive_task: asyncio.Task | None = None
+
+    @staticmethod
+    def partition_name(time: datetime) -> str:
+        """写入时间对应的月分区集合名"""
+        return f"{USER_BEHAVIOR_COLLECTION}_{time:%Y%m}"
+
+    @staticmethod
+    def previous_partition_name(name: str) -> str:
+        """上一个月分区的集合名"""
+        matched = PARTITION_PATTERN.match(name)
+        year, month = int(matched.group(1)), int(matched.group(2))
+        if month == 1:
+            year, month = year - 1, 12
+        else:
+            month -= 1
+        return f"{USER_BEHAVIOR_COLLECTION}_{year:04d}{month:02d}"
+
+    async def _ensure_partition(self, name: str):
+        """新分区创建索引（热门课程回放按写入时间范围读取，运维排查按用户读取）"""
+        if name in self._ready_partitions:
+            return
+        collection = mongodb_client_manager.get_collection(name)
+        await collection.create_index("inserted_time")
+        await collection.create_index("user_id")
+        self._ready_partitions.add(name)
+
+    async def insert_many(self, logs: list[dict]) -> tuple[list[int], list[int]]:
+        """
+        按写入时间（inserted_time）分区无序批量写入
+        _id 唯一约束只在分区内生效，跨月重投的消息首次写入在上月分区，写入前先按 _id 排除上月分区已有的文档
+        :return: (写入失败的下标, _id 已存在的下标)；_id 已存在表示消息重投前已写入
+        :raises BulkWriteError: 非单条文档错误（如写关注失败），无法确定哪些文档已写入
+        """
+        partitions: dict[str, list[int]] = {}
+        for index, log in enumerate(logs):
+            partitions.setdefault(self.partition_name(log["inserted_time"]), []).append(index)
+
+        failed_indexes = []
+        duplicate_indexes = []
+        for name, indexes in partitions.items():
+            existing = await self._existing_ids(self.previous_partition_name(name), [logs[i]["_id"] for i in indexes])
+            if existing:
+                duplicate_indexes.extend(i for i in indexes if logs[i]["_id"] in existing)
+                indexes = [i for i in indexes if logs[i]["_id"] not in existing]
+                if not indexes:
+                    continue
+
+            await self._ensure_partition(name)
+            collection = mongodb_client_manager.get_collection(name)
+            try:
+                await collection.insert_many([logs[i] for i in indexes], ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if not errors:
+                    raise
+                for error in errors:
+                    if error.get("code") == DUPLICATE_KEY_ERROR:
+                        duplicate_indexes.append(indexes[error["index"]])
+                    else:
+                        failed_indexes.append(indexes[error["index"]])
+        return sorted(failed_indexes), sorted(duplicate_indexes)
+
+    @staticmethod
+    async def _existing_ids(name: str, ids: list) -> set:
+        """分区中已存在的 _id（分区不存在时为空）"""
+        collection = mongodb_client_manager.get_collection(name)
+        return {doc["_id"] async for doc in collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+
+    async def list_partitions(self, since: datetime | None = None) -> list[str]:
+        """
+        列出现有分区（按时间升序，未分区的历史集合排在最前）
+        :param since: 只返回包含该时间之后数据的分区（历史集合始终包含）
+        """
+        names = await mongodb_client_manager.db.list_collection_names(
+            filter={"name": {"$regex": f"^{USER_BEHAVIOR_COLLECTION}(_\\d{{6}})?$"}}
+        )
+        min_partition = self.partition_name(since) if since else None
+        partitions = sorted(
+            name for name in names
+            if PARTITION_PATTERN.match(name) and (min_partition is None or name >= min_partition)
+        )
+        if USER_BEHAVIOR_COLLECTION in names:
+            partitions.insert(0, USER_BEHAVIOR_COLLECTION)
+        return partitions
+
+    async def aggregate(self, pipeline: list[dict], match: dict | None = None, since: datetime | None = None):
+        """
+        跨分区聚合
+        :param pipeline: 拼接全部分区后执行的聚合阶段
+        :param match: 下推到每个分区的过滤条件
+        :param since: 只读取包含该时间之后数据的分区
+        """
+        partitions = await self.list_partitions(since)
+        if not partitions:
+            return
+
+        match_stages = [{"$match": match}] if match else []
+        union_stages = [
+            {"$unionWith": {"coll": name, "pipeline": match_stages}}
+            for name in partitions[1:]
+        ]
+        collection = mongodb_client_manager.get_collection(partitions[0])
+        async for doc in collection.aggregate(match_stages + union_stages + pipeline, allowDiskUse=True):
+            yield doc
+
+    def _expired_partitions(self, partitions: list[str], now: datetime) -> list[str]:
+        """超过保留期（按整月计）的分区"""
+        current = now.year * 12 + now.month - 1
+        expired = []
+        for name in partitions:
+            matched = PARTITION_PATTERN.match(name)
+            if matched and current - (int(matched.group(1)) * 12 + int(matched.group(2)) - 1) > settings.behavior_log_retention_months:
+                expired.append(name)
+        return expired
+
+    async def archive_expired(self):
+        """将超过保留期的分区导出为 JSONL.gz 归档后删除"""
+        redis = redis_client_manager.get_client()
+        lock = redis.lock(self.ARCHIVE_LOCK_KEY, timeout=self.ARCHIVE_LOCK_TIMEOUT, blocking_timeout=0)
+        if not await lock.acquire(blocking=False):
+            return
+
+        keeper = self._keep_lock(lock)
+        try:
+            for name in self._expired_partitions(await self.list_partitions(), datetime.now()):
+                await self._archive_partition(name, lock)
+        finally:
+            keeper.cancel()
+            try:
+                await lock.release()
+            except Exception:
+                pass
+
+    def _keep_lock(self, lock) -> asyncio.Task:
+        """
+        导出耗时可能超过锁的有效期，执行期间定期续期；
+        续期失败（锁已过期被其他进程取得）时停止续期，删除数据前通过 lock.owned() 确认仍持有锁
+        """
+        async def extend():
+            while True:
+                await asyncio.sleep(self.ARCHIVE_LOCK_TIMEOUT / 3)
+                try:
+                    await lock.extend(self.ARCHIVE_LOCK_TIMEOUT, replace_ttl=True)
+                except LockError as e:
+                    logger.warning(f"行为日志归档锁已失效: {e}")
+                    return
+                except Exception as e:
+                    logger.error(f"行为日志归档锁续期失败: {e}")
+
+        return asyncio.create_task(extend())
+
+    async def _archive_partition(self, name: str, lock):
+        collection = mongodb_client_manager.get_collection(name)
+        path = os.path.join(settings.behavior_log_archive_dir, f"{name}.jsonl.gz")
+        # 归档期间仍有写入（如时钟回拨、延迟消息）时放弃删除，下次重新归档
+        if not await self._export(collection, {}, path):
+            logger.warning(f"行为日志分区归档期间数据有变化，稍后重试: {name}")
+            return
+
+        # 锁已失效时其他进程可能正在归档同一分区，放弃删除
+        if not await lock.owned():
+            logger.warning(f"行为日志归档锁已失效，放弃删除分区: {name}")
+            return
+        await collection.drop()
+        self._ready_partitions.discard(name)
+        logger.info(f"行为日志分区已归档: {name} -> {path}")
+
+    async def _export(self, collection, query: dict, path: str) -> bool:
+        """
+        导出匹配的文档为 JSONL.gz（先写临时文件，核对条数后再改名）
+        :return: 导出条数与当前匹配条数一致时返回 True，否则删除临时文件并返回 False
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+
+        exported = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            chunk = []
+            async for doc in collection.find(query).sort("_id", 1):
+                chunk.append(json.dumps(doc, ensure_ascii=False, default=str))
+                if len(chunk) >= self.ARCHIVE_CHUNK_SIZE:
+                    await asyncio.to_thread(f.write, "\n".join(chunk) + "\n")
+                    exported += len(chunk)
+                    chunk = []
+            if chunk:
+                await asyncio.to_thread(f.write, "\n".join(chunk) + "\n")
+                exported += len(chunk)
+
+        if exported != await collection.count_documents(query):
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+        return True
+
+    async def migrate_legacy(self):
+        """
+        迁移未分区的历史集合：按 inserted_time 逐月处理，
+        超过保留期的月份归档为 {分区名}_legacy.jsonl.gz，其余月份移入对应月分区（按 _id 去重）；
+        全部迁移后删除历史集合。可重复执行，中断后再次执行会继续处理剩余月份
+        """
+        redis = redis_client_manager.get_client()
+        lock = redis.lock(self.ARCHIVE_LOCK_KEY, timeout=self.ARCHIVE_LOCK_TIMEOUT, blocking_timeout=0)
+        if not await lock.acquire(blocking=False):
+            logger.warning("行为日志归档/迁移正在其他进程执行，本次未执行")
+            return
+
+        keeper = self._keep_lock(lock)
+        try:
+            legacy = mongodb_client_manager.get_collection(USER_BEHAVIOR_COLLECTION)
+            months = [
+                doc["_id"] async for doc in legacy.aggregate([
+                    {"$match": {"inserted_time": {"$type": "date"}}},
+                    {"$group": {"_id": {"$dateToString": {"format": "%Y%m", "date": "$inserted_time"}}}},
+                    {"$sort": {"_id": 1}}
+                ], allowDiskUse=True)
+            ]
+            names = [f"{USER_BEHAVIOR_COLLECTION}_{month}" for month in months]
+            expired = set(self._expired_partitions(names, datetime.now()))
+
+            for month, name in zip(months, names):
+                start = datetime(int(month[:4]), int(month[4:]), 1)
+                end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+                query = {"inserted_time": {"$gte": start, "$lt": end}}
+
+                if name in expired:
+                    path = os.path.join(settings.behavior_log_archive_dir, f"{name}_legacy.jsonl.gz")
+                    if not await self._export(legacy, query, path):
+                        logger.warning(f"历史行为日志归档期间数据有变化，跳过: {month}")
+                        continue
+                else:
+                    await self._ensure_partition(name)
+                    async for _ in legacy.aggregate([
+                        {"$match": query},
+                        {"$merge": {"into": name, "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}}
+                    ], allowDiskUse=True):
+                        pass
+
+                if not await lock.owned():
+                    logger.warning(f"行为日志归档锁已失效，停止迁移: {month}")
+                    return
+                result = await legacy.delete_many(query)
+                logger.info(f"历史行为日志已{'归档' if name in expired else '移入分区'}: {month}, {result.deleted_count} 条")
+
+            remaining = await legacy.count_documents({})
+            if remaining:
+                logger.warning(f"历史行为日志集合仍有 {remaining} 条无写入时间的文档，未删除集合")
+            else:
+                await legacy.drop()
+                logger.info("历史行为日志集合已迁移完成并删除")
+        finally:
+            keeper.cancel()
+            try:
+                await lock.release()
+            except Exception:
+                pass
+
+    async def start_archiver(self):
+        """启动定时归档"""
+        if self._archive_task is None:
+            self._archive_task = asyncio.create_task(self._archive_loop())
+
+    async def stop_archiver(self):
+        """停止定时归档"""
+        if self._archive_task:
+            self._archive_task.cancel()
+            try:
+                await self._archive_task
+            except asyncio.CancelledError:
+                pass
+            self._archive_task = None
+
+    async def _archive_loop(self):
+        while True:
+            try:
+                await self.archive_expired()
+            except Exception as e:
+                logger.error(f"行为日志归档失败: {e}")
+            await asyncio.sleep(settings.behavior_log_archive_interval)
+
+
+behavior_log_store = BehaviorLogStore()
+
+
+async def _run_migrate_legacy():
+    await redis_client_manager.init_pool()
+    await mongodb_client_manager.init_client()
+    try:
+        await behavior_log_store.migrate_legacy()
+    finally:
+        await mongodb_client_manager.close_client()
+        await redis_client_manager.close_pool()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="用户行为日志分区维护")
+    parser.add_argument("--migrate-legacy", action="store_true", help="迁移未分区的历史行为日志集合")
+    if parser.parse_args().migrate_legacy:
+        asyncio.run(_run_migrate_legacy())
+    else:
+        parser.print_help()
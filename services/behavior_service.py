@@ -7,9 +7,9 @@ from typing import Optional
 
 from fastapi import Request
 
-from models import MedicalCourse
 from models.schemas.behavior import UserBehaviorLog, ActionType, UserBehaviorLogRequest
-from services.behavior_consumer import publish_behavior_log
+from services.behavior_consumer import publish_behavior_log, publish_behavior_logs
+from services.course_card import course_card_service
 
 logger = logging.getLogger("api")
 
@@ -41,32 +41,14 @@ class UserBehaviorService:
         :return: 是否成功
         """
         try:
-            # 获取课程信息
-            course = await MedicalCourse.get_or_none(id=request_data.course_id)
+            # 获取课程信息（两级缓存，高频浏览行为不查库）
+            course = await course_card_service.get_card(request_data.course_id)
             if not course:
                 logger.warning(f"课程不存在: {request_data.course_id}")
                 return False
             
-            # 计算行为权重
-            action_value = request_data.action_value
-            if action_value is None:
-                action_value = self.ACTION_WEIGHTS.get(request_data.action_type, 1.0)
-            
             # 构建日志数据
-            log_data = UserBehaviorLog(
-                user_id=user_id,
-                course_id=request_data.course_id,
-                action_type=request_data.action_type,
-                action_value=action_value,
-                course_code=course.course_code,
-                course_name=course.course_name,
-                medical_department=course.medical_department,
-                difficulty_level=course.difficulty_level,
-                extra_info=request_data.extra_info or {},
-                created_time=datetime.now(),
-                ip_address=self._get_client_ip(request) if request else None,
-                user_agent=request.headers.get("user-agent") if request else None
-            )
+            log_data = self._build_log(user_id, request_data, course, request)
             
             # 发布到RabbitMQ
             await publish_behavior_log(log_data.model_dump())
@@ -78,6 +60,74 @@ class UserBehaviorService:
             logger.error(f"记录用户行为失败: {e}")
             return False
     
+    async def record_behaviors(
+        self,
+        user_id: int,
+        items: list[UserBehaviorLogRequest],
+        request: Optional[Request] = None
+    ) -> Optional[list[int]]:
+        """
+        批量记录用户行为（如前端缓冲的浏览、滚动事件）
+        课程信息一次批量获取，日志一次批量发布
+        :param user_id: 用户ID
+        :param items: 行为请求数据列表
+        :param request: FastAPI请求对象（用于获取IP等信息）
+        :return: 因课程不存在被拒绝的下标列表，发布失败时返回 None
+        """
+        try:
+            cards = await course_card_service.get_cards([item.course_id for item in items])
+            courses = {card["course_id"]: card for card in cards}
+            
+            logs = []
+            rejected = []
+            for index, item in enumerate(items):
+                course = courses.get(item.course_id)
+                if not course:
+                    rejected.append(index)
+                    continue
+                logs.append(self._build_log(user_id, item, course, request).model_dump())
+            
+            if rejected:
+                logger.warning(f"批量记录行为时课程不存在: user_id={user_id}, {[items[i].course_id for i in rejected]}")
+            
+            if logs:
+                await publish_behavior_logs(logs)
+            
+            logger.info(f"用户行为已批量记录: user_id={user_id}, count={len(logs)}")
+            return rejected
+            
+        except Exception as e:
+            logger.error(f"批量记录用户行为失败: {e}")
+            return None
+    
+    def _build_log(
+        self,
+        user_id: int,
+        request_data: UserBehaviorLogRequest,
+        course: dict,
+        request: Optional[Request] = None
+    ) -> UserBehaviorLog:
+        """构建行为日志（冗余课程信息）"""
+        # 计算行为权重
+        action_value = request_data.action_value
+        if action_value is None:
+            action_value = self.ACTION_WEIGHTS.get(request_data.action_type, 1.0)
+        
+        return UserBehaviorLog(
+            user_id=user_id,
+            course_id=request_data.course_id,
+            action_type=request_data.action_type,
+            action_value=action_value,
+            course_code=course["course_code"],
+            course_name=course["course_name"],
+            medical_department=course["medical_department"],
+            difficulty_level=course["difficulty_level"],
+            extra_info=request_data.extra_info or {},
+            created_time=datetime.now(),
+            ip_address=self._get_client_ip(request) if request else None,
+            user_agent=request.headers.get("user-agent") if request else None
+        )
+    
     async def record_view(self, user_id: int, course_id: int, request: Optional[Request] = None) -> bool:
         """快捷方法：记录浏览行为"""
         return await self.record_behavior(
@@ -0,0 +1,127 @@
+"""
+课程属性编码与向量化属性相似度
+属性：medical_department（科室）, difficulty_level（难度）, applicable_title（适用职称）
+字符串属性一次性编码为整型数组，相似度通过广播按块计算，不再逐对调用 Python 函数
+"""
+import numpy as np
+
+from models import MedicalCourse
+
+# 属性相似度打分规则（与逐对计算版本保持一致）
+DEPARTMENT_SCORE = 0.5       # 科室相同
+DIFFICULTY_MAX_SCORE = 0.3   # 难度相同时的得分，每差一级扣 DIFFICULTY_STEP
+DIFFICULTY_STEP = 0.1
+TITLE_SCORE = 0.2            # 适用职称相同（均非空）
+
+# 缺失值编码
+MISSING_CODE = -1
+
+
+class CourseAttributeEncoding:
+    """课程属性整型编码，各数组与 course_ids 一一对齐"""
+
+    def __init__(
+        self,
+        version: str,
+        course_ids: np.ndarray,
+        department_codes: np.ndarray,
+        difficulty_levels: np.ndarray,
+        title_codes: np.ndarray
+    ):
+        self.version = version
+        self.course_ids = course_ids.astype(np.int64)
+        self.department_codes = department_codes.astype(np.int32)
+        self.difficulty_levels = difficulty_levels.astype(np.float32)
+        self.title_codes = title_codes.astype(np.int32)
+
+    @classmethod
+    async def load(cls, version: str) -> "CourseAttributeEncoding":
+        """从数据库加载全部课程属性并编码"""
+        rows = await MedicalCourse.all().values_list(
+            "id", "medical_department", "difficulty_level", "applicable_title"
+        )
+        rows.sort(key=lambda r: r[0])
+
+        course_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        difficulty_levels = np.array([r[2] for r in rows], dtype=np.float32)
+        department_codes = cls._encode([r[1] for r in rows])
+        title_codes = cls._encode([r[3] for r in rows])
+
+        return cls(version, course_ids, department_codes, difficulty_levels, title_codes)
+
+    @staticmethod
+    def _encode(values: list) -> np.ndarray:
+        """字符串编码为整型，空值编码为 MISSING_CODE"""
+        codes: dict[str, int] = {}
+        return np.array(
+            [codes.setdefault(v, len(codes)) if v else MISSING_CODE for v in values],
+            dtype=np.int32
+        )
+
+    def take(self, course_ids: list[int]) -> "CourseAttributeEncoding":
+        """
+        按给定课程顺序取出编码，不存在的课程各属性均为缺失
+        :param course_ids: 课程ID列表（如用户-物品矩阵的列顺序）
+        """
+        ids = np.asarray(course_ids, dtype=np.int64)
+        positions = np.searchsorted(self.course_ids, ids)
+        positions = np.clip(positions, 0, max(len(self.course_ids) - 1, 0))
+        if len(self.course_ids):
+            found = self.course_ids[positions] == ids
+        else:
+            found = np.zeros(len(ids), dtype=bool)
+
+        def gather(values: np.ndarray, missing):
+            result = np.full(len(ids), missing, dtype=values.dtype)
+            result[found] = values[positions[found]]
+            return result
+
+        return CourseAttributeEncoding(
+            version=self.version,
+            course_ids=ids,
+            department_codes=gather(self.department_codes, MISSING_CODE),
+            difficulty_levels=gather(self.difficulty_levels, np.nan),
+            title_codes=gather(self.title_codes, MISSING_CODE),
+        )
+
+    def similarity_block(self, start: int, end: int) -> np.ndarray:
+        """
+        计算第 start~end 行与全部课程的属性相似度（广播）
+        :return: (end - start) × n 的 float32 矩阵
+        """
+        dept = self.department_codes
+        difficulty = self.difficulty_levels
+        title = self.title_codes
+        rows = slice(start, end)
+
+        # 科室相同 +0.5（缺失科室视为课程不存在）
+        exists = dept != MISSING_CODE
+        same_department = dept[rows, None] == dept[None, :]
+        score = np.where(same_department, DEPARTMENT_SCORE, 0.0).astype(np.float32)
+
+        # 难度等级差异（差异越小越相似）
+        difficulty_diff = np.abs(difficulty[rows, None] - difficulty[None, :])
+        score += np.nan_to_num(np.maximum(0.0, DIFFICULTY_MAX_SCORE - difficulty_diff * DIFFICULTY_STEP))
+
+        # 适用职称相同 +0.2
+        same_title = (title[rows, None] == title[None, :]) & (title[rows, None] != MISSING_CODE)
+        score += np.where(same_title, TITLE_SCORE, 0.0).astype(np.float32)
+
+        np.minimum(score, 1.0, out=score)
+
+        # 任一课程不存在时相似度为 0，自身相似度为 1
+        score[~exists[rows], :] = 0.0
+        score[:, ~exists] = 0.0
+        score[np.arange(end - start), np.arange(start, end)] = 1.0
+        return score
+
+    def similarity_matrix(self) -> np.ndarray:
+        """计算完整的 n × n 属性相似度矩阵"""
+        return self.similarity_block(0, len(self.course_ids))
+
+
+async def get_catalog_version() -> str:
+    """课程目录版本：课程总数 + 最近更新时间，任一课程增删改都会改变版本"""
+    total = await MedicalCourse.all().count()
+    latest = await MedicalCourse.all().order_by("-updated_time").first().values_list("updated_time", flat=True)
+    return f"{total}:{latest.isoformat() if latest else ''}"
@@ -0,0 +1,188 @@
+"""
+课程卡片（课程元数据）两级缓存
+行为日志冗余字段、推荐列表、热门课程等只需要课程的少量展示字段，统一在这里批量查询并缓存：
+- 一级：进程内 LRU（带 TTL）
+- 二级：Redis，多个进程共享，一级未命中时一次 MGET 取回
+- 两级都未命中的课程一次 SQL 查询取回并回填
+课程保存/删除时通过 Tortoise 信号删除 Redis 缓存，并经 Redis 发布订阅通知各进程清除本地缓存
+（QuerySet.update 不触发信号，批量更新课程后需手动调用 invalidate）
+"""
+import asyncio
+import json
+import logging
+
+from tortoise.signals import post_delete, post_save
+
+from core.config import settings
+from core.redis_client import redis_client_manager
+from models import MedicalCourse
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger("api")
+
+# 课程卡片所需字段（RecommendationItem 展示字段 + 行为日志冗余字段 + 状态过滤字段）
+COURSE_CARD_FIELDS = (
+    "id", "course_code", "course_name", "medical_department",
+    "difficulty_level", "price", "status", "sale_status",
+)
+
+
+class CourseCardService:
+    """课程卡片服务：按ID批量加载，保持调用方给定的顺序"""
+
+    KEY_PREFIX = "course:card"
+    INVALIDATE_CHANNEL = "course:card:invalidate"
+
+    # 订阅断开后重连的等待时间（秒）
+    RESUBSCRIBE_DELAY = 1.0
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=settings.course_card_cache_size, ttl=settings.course_card_cache_ttl)
+        self._listener_task: asyncio.Task | None = None
+
+    def _key(self, course_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{course_id}"
+
+    async def get_card(self, course_id: int) -> dict | None:
+        """
+        获取单个课程卡片
+        :return: 课程卡片，课程不存在时返回 None
+        """
+        cards = await self.get_cards([course_id])
+        return cards[0] if cards else None
+
+    async def get_cards(self, course_ids: list[int]) -> list[dict]:
+        """
+        批量获取课程卡片
+        :param course_ids: 课程ID列表（已按排名排序）
+        :return: 课程卡片列表，顺序与 course_ids 一致，不存在的课程被跳过
+        """
+        cards: dict[int, dict] = {}
+        missing_ids = []
+        for course_id in dict.fromkeys(course_ids):
+            card = self._cache.get(course_id)
+            if card is not None:
+                cards[course_id] = card
+            else:
+                missing_ids.append(course_id)
+
+        # 本地未命中的课程从 Redis 批量取回
+        if missing_ids:
+            missing_ids = await self._load_from_redis(missing_ids, cards)
+
+        # Redis 也未命中的课程一次查询取回
+        if missing_ids:
+            rows = await MedicalCourse.filter(id__in=missing_ids).values(*COURSE_CARD_FIELDS)
+            loaded = [self._to_card(row) for row in rows]
+            for card in loaded:
+                cards[card["course_id"]] = card
+                self._cache.set(card["course_id"], card)
+            await self._store_to_redis(loaded)
+
+        return [cards[course_id] for course_id in course_ids if course_id in cards]
+
+    async def invalidate(self, course_id: int):
+        """使课程卡片缓存失效（本进程、Redis，并通知其他进程）"""
+        self._cache.delete(course_id)
+        try:
+            redis = redis_client_manager.get_client()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.delete(self._key(course_id))
+                pipe.publish(self.INVALIDATE_CHANNEL, course_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"课程卡片缓存失效失败: course_id={course_id}, {e}")
+
+    async def start_listener(self):
+        """订阅缓存失效通知"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop_listener(self):
+        """停止订阅"""
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = redis_client_manager.get_client().pubsub()
+                async with pubsub:
+                    await pubsub.subscribe(self.INVALIDATE_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._cache.delete(int(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"课程卡片失效通知订阅中断: {e}")
+                # 订阅中断期间可能错过通知，清空本地缓存
+                self._cache.clear()
+                await asyncio.sleep(self.RESUBSCRIBE_DELAY)
+
+    async def _load_from_redis(self, course_ids: list[int], cards: dict[int, dict]) -> list[int]:
+        """从 Redis 读取课程卡片写入 cards，返回仍未命中的课程ID（Redis 不可用时全部视为未命中）"""
+        try:
+            redis = redis_client_manager.get_client()
+            values = await redis.mget([self._key(course_id) for course_id in course_ids])
+        except Exception as e:
+            logger.error(f"读取课程卡片缓存失败: {e}")
+            return course_ids
+
+        missing_ids = []
+        for course_id, value in zip(course_ids, values):
+            if value is None:
+                missing_ids.append(course_id)
+                continue
+            card = json.loads(value)
+            cards[course_id] = card
+            self._cache.set(course_id, card)
+        return missing_ids
+
+    async def _store_to_redis(self, cards: list[dict]):
+        if not cards:
+            return
+        try:
+            redis = redis_client_manager.get_client()
+            async with redis.pipeline(transaction=False) as pipe:
+                for card in cards:
+                    pipe.set(
+                        self._key(card["course_id"]),
+                        json.dumps(card, ensure_ascii=False),
+                        ex=settings.course_card_redis_ttl
+                    )
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"写入课程卡片缓存失败: {e}")
+
+    @staticmethod
+    def _to_card(row: dict) -> dict:
+        return {
+            "course_id": row["id"],
+            "course_code": row["course_code"],
+            "course_name": row["course_name"],
+            "medical_department": row["medical_department"],
+            "difficulty_level": row["difficulty_level"],
+            "price": float(row["price"]),
+            "status": row["status"],
+            "sale_status": row["sale_status"],
+        }
+
+
+course_card_service = CourseCardService()
+
+
+@post_save(MedicalCourse)
+async def _on_course_saved(sender, instance: MedicalCourse, created, using_db, update_fields):
+    if not created:
+        await course_card_service.invalidate(instance.id)
+
+
+@post_delete(MedicalCourse)
+async def _on_course_deleted(sender, instance: MedicalCourse, using_db):
+    await course_card_service.invalidate(instance.id)
@@ -0,0 +1,162 @@
+"""
+热门课程排行榜（Redis ZSET）
+行为消费者每写入一条行为就按时间衰减累加课程热度，查询热门课程只需一次 ZREVRANGE
+
+时间衰减采用前向衰减（forward decay）：
+    score += weight * 2 ^ ((now - t0) / half_life)
+越新的行为增量越大，等价于旧分数按半衰期衰减，且排名只依赖相对大小，读取时无需重新计算。
+增量随时间指数增长，超过 REBASE_HALF_LIVES 个半衰期后整体缩放并重置 t0，防止浮点溢出。
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from core.redis_client import redis_client_manager
+
+logger = logging.getLogger("api")
+
+# 时间窗口 -> 半衰期（秒）
+HOT_COURSE_WINDOWS = {
+    "hour": 60 * 60,
+    "day": 60 * 60 * 24,
+    "week": 60 * 60 * 24 * 7,
+}
+DEFAULT_WINDOW = "day"
+
+# 超过多少个半衰期后重置基准时间
+REBASE_HALF_LIVES = 64
+
+# KEYS[1]: 排行榜 ZSET  KEYS[2]: 基准时间 HASH
+# ARGV[1]: 半衰期  ARGV[2]: 当前时间  ARGV[3]: 重置阈值  ARGV[4...]: course_id, weight 成对出现
+RECORD_SCRIPT = """
+local half_life = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local t0 = tonumber(redis.call('HGET', KEYS[2], KEYS[1]))
+if not t0 then
+    t0 = now
+    redis.call('HSET', KEYS[2], KEYS[1], t0)
+end
+local elapsed = (now - t0) / half_life
+if elapsed > tonumber(ARGV[3]) then
+    redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', tostring(2 ^ (-elapsed)))
+    t0 = now
+    elapsed = 0
+    redis.call('HSET', KEYS[2], KEYS[1], t0)
+end
+local factor = 2 ^ elapsed
+for i = 4, #ARGV, 2 do
+    redis.call('ZINCRBY', KEYS[1], tostring(tonumber(ARGV[i + 1]) * factor), ARGV[i])
+end
+return 1
+"""
+
+
+class HotCourseLeaderboard:
+    """热门课程排行榜"""
+
+    KEY_PREFIX = "recommendation:hot_courses"
+    BASE_TIME_KEY = "recommendation:hot_courses:base_time"
+    SEED_LOCK_KEY = "recommendation:hot_courses:seed_lock"
+
+    def __init__(self):
+        self._script = None
+
+    def _key(self, window: str) -> str:
+        return f"{self.KEY_PREFIX}:{window}"
+
+    def _get_script(self, redis):
+        if self._script is None:
+            self._script = redis.register_script(RECORD_SCRIPT)
+        return self._script
+
+    async def record(self, course_weights: dict[int, float], event_time: float | None = None):
+        """
+        累加课程热度（所有时间窗口）
+        :param course_weights: {course_id: 行为权重之和}
+        :param event_time: 行为时间戳，默认当前时间
+        """
+        if not course_weights:
+            return
+        now = event_time or time.time()
+        args = []
+        for course_id, weight in course_weights.items():
+            args.extend([course_id, weight])
+
+        redis = redis_client_manager.get_client()
+        script = self._get_script(redis)
+        async with redis.pipeline(transaction=False) as pipe:
+            for window, half_life in HOT_COURSE_WINDOWS.items():
+                await script(
+                    keys=[self._key(window), self.BASE_TIME_KEY],
+                    args=[half_life, now, REBASE_HALF_LIVES, *args],
+                    client=pipe
+                )
+            await pipe.execute()
+
+    async def top(self, top_n: int, exclude_ids: list[int] | None = None, window: str = DEFAULT_WINDOW) -> list[int]:
+        """
+        获取热度最高的课程ID
+        :param top_n: 数量
+        :param exclude_ids: 需要排除的课程ID
+        :param window: 时间窗口（hour / day / week）
+        """
+        if window not in HOT_COURSE_WINDOWS:
+            window = DEFAULT_WINDOW
+        exclude = set(exclude_ids or [])
+
+        redis = redis_client_manager.get_client()
+        members = await redis.zrevrange(self._key(window), 0, top_n + len(exclude) - 1)
+
+        course_ids = []
+        for member in members:
+            course_id = int(member)
+            if course_id not in exclude:
+                course_ids.append(course_id)
+                if len(course_ids) >= top_n:
+                    break
+        return course_ids
+
+    async def seed_from_history(self, log_store, days: int = 7):
+        """
+        排行榜为空时（如首次部署）从行为日志回放最近的数据
+        按小时分桶聚合，以桶时间作为行为时间累加，保持衰减效果
+        :param log_store: 用户行为日志分区存储
+        :param days: 回放天数
+        """
+        redis = redis_client_manager.get_client()
+        if await redis.exists(self._key(DEFAULT_WINDOW)):
+            return
+
+        lock = redis.lock(self.SEED_LOCK_KEY, timeout=60 * 10, blocking_timeout=0)
+        if not await lock.acquire(blocking=False):
+            return
+
+        try:
+            since = datetime.now() - timedelta(days=days)
+            pipeline = [
+                {"$group": {
+                    "_id": {
+                        "hour": {"$dateToString": {"format": "%Y-%m-%dT%H:00:00", "date": "$inserted_time"}},
+                        "course_id": "$course_id"
+                    },
+                    "total_weight": {"$sum": "$action_value"}
+                }},
+                {"$sort": {"_id.hour": 1}}
+            ]
+
+            buckets: dict[str, dict[int, float]] = {}
+            async for doc in log_store.aggregate(pipeline, match={"inserted_time": {"$gte": since}}, since=since):
+                buckets.setdefault(doc["_id"]["hour"], {})[doc["_id"]["course_id"]] = doc["total_weight"] or 0.0
+
+            for hour, course_weights in buckets.items():
+                await self.record(course_weights, datetime.fromisoformat(hour).timestamp())
+
+            logger.info(f"热门课程排行榜已从行为日志回放: {len(buckets)} 个小时桶")
+        finally:
+            try:
+                await lock.release()
+            except Exception:
+                pass
+
+
+hot_course_leaderboard = HotCourseLeaderboard()
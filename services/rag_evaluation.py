@@ -0,0 +1,125 @@
+"""
+RAG 抽样评估
+对话结束后按比例抽样，将问题、检索片段和回答发布到评估队列，
+由后台消费者调用 LLM 评分并写入 MongoDB rag_evaluation 集合，对话链路不再等待评估。
+"""
+import json
+import logging
+import random
+from datetime import datetime
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from core.ai import llm
+from core.config import settings
+from core.mongodb_client import mongodb_client_manager
+from core.rabbitmq_client import rabbitmq_client_manager, RabbitMQClientManager
+
+logger = logging.getLogger("api")
+
+# MongoDB集合名称
+RAG_EVALUATION_COLLECTION = "rag_evaluation"
+
+EVALUATION_PROMPT = """
+你是一个 RAG 系统质量评估专家。请根据【用户问题】、【检索片段】和【系统回答】进行评分，每项 1~5 分：
+1. context_recall：检索片段是否覆盖回答问题所需的信息（召回率）。
+2. context_precision：检索片段中与问题相关的内容占比。
+3. faithfulness：回答是否完全基于检索片段，没有编造。
+4. answer_relevance：回答是否切题、完整。
+
+只输出 JSON，不要解释，格式：
+{"context_recall": 分数, "context_precision": 分数, "faithfulness": 分数, "answer_relevance": 分数, "comment": "一句话评语"}
+"""
+
+SCORE_FIELDS = ("context_recall", "context_precision", "faithfulness", "answer_relevance")
+
+
+async def submit_rag_evaluation(
+        user_id: int,
+        session_id: str,
+        question: str,
+        standalone_question: str,
+        queries: list[str],
+        contexts: list[str],
+        answer: str
+):
+    """
+    按抽样比例提交对话评估（经发布缓冲区发布，不等待 broker 确认；失败只记录日志）
+    :param question: 用户原始问题
+    :param standalone_question: 改写后的独立问题
+    :param queries: 检索词
+    :param contexts: 去重后的检索片段
+    :param answer: 最终回答
+    """
+    if random.random() >= settings.rag_evaluation_sample_rate:
+        return
+
+    try:
+        await rabbitmq_client_manager.publish_message_buffered(RabbitMQClientManager.RAG_EVALUATION_QUEUE, {
+            "user_id": user_id,
+            "session_id": session_id,
+            "question": question,
+            "standalone_question": standalone_question,
+            "queries": queries,
+            "contexts": contexts,
+            "answer": answer,
+            "created_time": datetime.now(),
+        })
+    except Exception as e:
+        logger.error(f"提交 RAG 评估失败: {e}")
+
+
+def _parse_scores(content: str) -> dict:
+    """解析评估结果，兼容 LLM 输出的代码块包裹"""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").removeprefix("json").strip()
+    result = json.loads(content)
+    scores = {field: result.get(field) for field in SCORE_FIELDS}
+    scores["comment"] = result.get("comment")
+    return scores
+
+
+async def evaluate_rag(message: dict):
+    """
+    评估一次对话并写入评估结果
+    :param message: submit_rag_evaluation 发布的消息体
+    """
+    contexts_text = "\n\n".join(message["contexts"])
+    response = await llm.ainvoke([
+        SystemMessage(content=EVALUATION_PROMPT),
+        HumanMessage(content=f"【用户问题】: {message['question']}\n"
+                             f"【检索片段】:\n{contexts_text}\n"
+                             f"【系统回答】: {message['answer']}")
+    ])
+
+    try:
+        scores = _parse_scores(response.content)
+    except (ValueError, AttributeError) as e:
+        logger.warning(f"RAG 评估结果解析失败: {e}")
+        scores = {field: None for field in SCORE_FIELDS}
+        scores["comment"] = None
+
+    collection = mongodb_client_manager.get_collection(RAG_EVALUATION_COLLECTION)
+    await collection.insert_one({
+        **message,
+        "created_time": datetime.fromisoformat(message["created_time"]),
+        **scores,
+        "raw_evaluation": response.content,
+        "evaluated_time": datetime.now(),
+    })
+
+
+async def start_rag_evaluation_consumer():
+    """启动 RAG 评估消费者（评估失败的消息直接丢弃，不影响对话）"""
+    try:
+        await rabbitmq_client_manager.start_consumer(
+            RabbitMQClientManager.RAG_EVALUATION_QUEUE,
+            evaluate_rag,
+            workers=settings.rag_evaluation_workers,
+            prefetch_count=settings.rag_evaluation_prefetch_count
+        )
+        logger.info("RAG 评估消费者已启动")
+    except Exception as e:
+        logger.error(f"启动 RAG 评估消费者失败: {e}")
+        raise
@@ -1,26 +1,36 @@
 """
 基于物品的协同过滤推荐算法
 混合模式：用户行为相似度 + 课程属性相似度
+相似度模型离线构建（见 services/recommendation_model.py），在线请求只做打分
 """
 import logging
-from collections import defaultdict
+from array import array
 
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
 
-from core.mongodb_client import mongodb_client_manager
+from core.compute_pool import compute_pool
+from core.config import settings
 from models import MedicalCourse
 from models.schemas.behavior import ActionType
+from services.course_attribute import CourseAttributeEncoding, get_catalog_version
+from services.course_card import course_card_service
+from services.hot_course_leaderboard import hot_course_leaderboard, DEFAULT_WINDOW
+from services.recommendation_cache import recommendation_result_cache
+from services.recommendation_model import ItemSimilarityModel, RecommendationModelManager, compute_hybrid_top_k
+from services.user_course_score import user_course_score_rollup
+from services.user_profile_cache import user_profile_cache
 
 logger = logging.getLogger("api")
 
-# MongoDB集合名称
-USER_BEHAVIOR_COLLECTION = "user_behavior_log"
-
 
 class ItemBasedCFRecommender:
     """基于物品的协同过滤推荐器"""
     
+    # 算法名称（结果缓存、模型目录均按算法隔离）
+    ALGORITHM = "item_cf"
+    MODEL_CLASS = ItemSimilarityModel
+    
     # 行为权重配置
     BEHAVIOR_WEIGHTS = {
         ActionType.VIEW.value: 1.0,
@@ -35,15 +45,24 @@ class ItemBasedCFRecommender:
     ATTRIBUTE_WEIGHT = 0.3  # 属性相似度占比
     BEHAVIOR_WEIGHT = 0.7   # 行为相似度占比
     
+    # 分块计算相似度时每块的课程数
+    SIMILARITY_BLOCK_SIZE = 1024
+    
     def __init__(self):
-        self._collection = None
+        self._score_collection = None
+        self._attribute_encoding: CourseAttributeEncoding | None = None
+        self.model_manager = RecommendationModelManager(
+            builder=self.build_model,
+            model_cls=self.MODEL_CLASS,
+            name=self.ALGORITHM
+        )
     
     @property
-    def collection(self):
-        """获取MongoDB集合"""
-        if self._collection is None:
-            self._collection = mongodb_client_manager.get_collection(USER_BEHAVIOR_COLLECTION)
-        return self._collection
+    def score_collection(self):
+        """获取用户-课程评分汇总集合"""
+        if self._score_collection is None:
+            self._score_collection = user_course_score_rollup.collection
+        return self._score_collection
     
     async def get_recommendations(
         self,
@@ -58,6 +77,23 @@ class ItemBasedCFRecommender:
         :param exclude_interacted: 是否排除用户已交互的课程
         :return: 推荐课程列表
         """
+        model = self.model_manager.current
+        return await recommendation_result_cache.get_or_compute(
+            algorithm=self.ALGORITHM,
+            user_id=user_id,
+            top_n=top_n,
+            exclude_interacted=exclude_interacted,
+            model_version=model.version if model else None,
+            compute=lambda: self._compute_recommendations(user_id, top_n, exclude_interacted)
+        )
+    
+    async def _compute_recommendations(
+        self,
+        user_id: int,
+        top_n: int,
+        exclude_interacted: bool
+    ) -> list[dict]:
+        """计算推荐课程列表（不经过结果缓存）"""
         try:
             # 1. 获取用户交互过的课程
             user_courses = await self._get_user_interacted_courses(user_id)
@@ -67,23 +103,19 @@ class ItemBasedCFRecommender:
                 logger.info(f"用户 {user_id} 无交互记录，返回热门课程")
                 return await self._get_hot_courses(top_n)
             
-            # 2. 构建用户-物品评分矩阵
-            user_item_matrix, course_ids, user_ids = await self._build_user_item_matrix()
-            
-            if len(course_ids) < 2:
+            # 2. 获取离线构建的相似度模型（尚未就绪时限时等待构建，超时返回热门课程）
+            model = self.model_manager.current
+            if model is None:
+                model = await self.model_manager.wait_for_model(settings.recommendation_compute_timeout)
+            if model is None:
+                logger.info("推荐模型尚未就绪，返回热门课程")
                 return await self._get_hot_courses(top_n)
             
-            # 3. 计算物品相似度矩阵（混合模式）
-            item_similarity = await self._compute_hybrid_similarity(user_item_matrix, course_ids)
-            
-            # 4. 为用户生成推荐
+            # 3. 为用户生成推荐
             recommendations = await self._generate_recommendations(
+                model=model,
                 user_id=user_id,
                 user_courses=user_courses,
-                item_similarity=item_similarity,
-                course_ids=course_ids,
-                user_item_matrix=user_item_matrix,
-                user_ids=user_ids,
                 top_n=top_n,
                 exclude_interacted=exclude_interacted
             )
@@ -95,191 +127,141 @@ class ItemBasedCFRecommender:
             # 发生错误时返回热门课程
             return await self._get_hot_courses(top_n)
     
-    async def _get_user_interacted_courses(self, user_id: int) -> dict[int, float]:
+    async def build_model(self) -> ItemSimilarityModel | None:
         """
-        获取用户交互过的课程及其评分
-        :return: {course_id: weighted_score}
+        离线构建物品相似度模型
+        :return: 模型，行为数据不足时返回 None
         """
-        pipeline = [
-            {"$match": {"user_id": user_id}},
-            {"$group": {
-                "_id": "$course_id",
-                "total_weight": {"$sum": "$action_value"},
-                "actions": {"$push": "$action_type"}
-            }}
-        ]
+        # 1. 构建用户-物品评分矩阵
+        user_item_matrix, course_ids, user_ids = await self._build_user_item_matrix()
         
-        result = {}
-        async for doc in self.collection.aggregate(pipeline):
-            result[doc["_id"]] = doc["total_weight"]
+        if len(course_ids) < 2:
+            return None
         
-        return result
+        # 2. 计算物品相似度（混合模式，每个课程保留 Top-K 近邻）
+        neighbour_indices, neighbour_scores = await self._compute_hybrid_similarity(user_item_matrix, course_ids)
+        
+        # 3. 截断低相似度近邻，压缩为紧凑的近邻索引
+        return ItemSimilarityModel.from_top_k(
+            course_ids=np.array(course_ids),
+            top_k_indices=neighbour_indices,
+            top_k_scores=neighbour_scores,
+            min_similarity=settings.recommendation_min_similarity
+        )
     
-    async def _build_user_item_matrix(self) -> tuple[np.ndarray, list[int], list[int]]:
+    async def _get_user_interacted_courses(self, user_id: int) -> dict[int, float]:
         """
-        构建用户-物品评分矩阵
-        :return: (矩阵, 课程ID列表, 用户ID列表)
+        获取用户交互过的课程及其评分（优先读取用户画像缓存）
+        :return: {course_id: weighted_score}
         """
-        # 聚合所有用户对课程的评分
-        pipeline = [
-            {"$group": {
-                "_id": {"user_id": "$user_id", "course_id": "$course_id"},
-                "total_weight": {"$sum": "$action_value"}
-            }}
-        ]
-        
-        # 收集数据
-        user_course_scores = defaultdict(dict)
-        all_courses = set()
-        all_users = set()
-        
-        async for doc in self.collection.aggregate(pipeline):
-            user_id = doc["_id"]["user_id"]
-            course_id = doc["_id"]["course_id"]
-            score = doc["total_weight"]
-            
-            user_course_scores[user_id][course_id] = score
-            all_courses.add(course_id)
-            all_users.add(user_id)
-        
-        # 转换为矩阵
-        course_ids = sorted(list(all_courses))
-        user_ids = sorted(list(all_users))
+        return await user_profile_cache.get(user_id, self._aggregate_user_interacted_courses)
+    
+    async def _aggregate_user_interacted_courses(self, user_id: int) -> dict[int, float]:
+        """
+        从用户-课程评分汇总读取用户交互过的课程及其衰减评分（画像缓存重建）
+        :return: {course_id: weighted_score}
+        """
+        return await user_course_score_rollup.get_user_scores(user_id)
+    
+    async def _build_user_item_matrix(self) -> tuple[sparse.csr_matrix, list[int], list[int]]:
+        """
+        构建用户-物品评分矩阵（稀疏 CSR）
+        读取增量维护的用户-课程衰减评分汇总，逐条写入 int32 行列索引 + float32 评分的 COO 数组，不创建稠密矩阵
+        :return: (稀疏矩阵, 课程ID列表, 用户ID列表)
+        """
+        # 汇总评分相对衰减基准时间，统一换算为当前时刻的衰减评分
+        decay = user_course_score_rollup.read_factor()
         
-        course_idx = {cid: idx for idx, cid in enumerate(course_ids)}
-        user_idx = {uid: idx for idx, uid in enumerate(user_ids)}
+        # 按出现顺序分配行列号
+        user_idx: dict[int, int] = {}
+        course_idx: dict[int, int] = {}
+        rows = array("i")
+        cols = array("i")
+        values = array("f")
         
-        matrix = np.zeros((len(user_ids), len(course_ids)))
+        cursor = self.score_collection.find({}, {"_id": 0, "user_id": 1, "course_id": 1, "score": 1})
+        async for doc in cursor:
+            rows.append(user_idx.setdefault(doc["user_id"], len(user_idx)))
+            cols.append(course_idx.setdefault(doc["course_id"], len(course_idx)))
+            values.append((doc["score"] or 0.0) * decay)
         
-        for user_id, courses in user_course_scores.items():
-            for course_id, score in courses.items():
-                matrix[user_idx[user_id]][course_idx[course_id]] = score
+        matrix = sparse.coo_matrix(
+            (
+                np.asarray(values, dtype=np.float32),
+                (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32))
+            ),
+            shape=(len(user_idx), len(course_idx))
+        ).tocsr()
         
-        return matrix, course_ids, user_ids
+        return matrix, list(course_idx), list(user_idx)
     
     async def _compute_hybrid_similarity(
         self,
-        user_item_matrix: np.ndarray,
+        user_item_matrix: sparse.csr_matrix,
         course_ids: list[int]
-    ) -> np.ndarray:
+    ) -> tuple[np.ndarray, np.ndarray]:
         """
-        计算混合相似度矩阵（行为 + 属性）
+        计算混合相似度（行为 + 属性）
+        按行分块计算，每个课程只保留 top-k 近邻，内存占用为 O(块大小 × n + n × k)
+        :return: (近邻下标矩阵 n×k int32, 近邻相似度矩阵 n×k float32)
         """
-        # 1. 计算基于行为的物品相似度（余弦相似度）
-        item_matrix = user_item_matrix.T  # 转置为物品-用户矩阵
-        behavior_similarity = cosine_similarity(item_matrix)
-        
-        # 2. 计算基于属性的物品相似度
-        attribute_similarity = await self._compute_attribute_similarity(course_ids)
+        # 1. 获取课程属性编码，用于按块计算属性相似度
+        attributes = await self._compute_attribute_similarity(course_ids)
         
-        # 3. 混合两种相似度
-        hybrid_similarity = (
-            self.BEHAVIOR_WEIGHT * behavior_similarity +
-            self.ATTRIBUTE_WEIGHT * attribute_similarity
+        # 2. 分块计算混合相似度并取 top-k（CPU 密集，在独立进程中执行，不阻塞事件循环）
+        return await compute_pool.run(
+            compute_hybrid_top_k,
+            user_item_matrix,
+            attributes,
+            min(settings.recommendation_neighbour_k, len(course_ids) - 1),
+            self.SIMILARITY_BLOCK_SIZE,
+            self.BEHAVIOR_WEIGHT,
+            self.ATTRIBUTE_WEIGHT,
+            key=("hybrid_similarity", attributes.version, user_item_matrix.shape, user_item_matrix.nnz),
+            timeout=settings.recommendation_model_build_timeout
         )
-        
-        return hybrid_similarity
     
-    async def _compute_attribute_similarity(self, course_ids: list[int]) -> np.ndarray:
+    async def _compute_attribute_similarity(self, course_ids: list[int]) -> CourseAttributeEncoding:
         """
-        基于课程属性计算相似度
+        获取与 course_ids 对齐的课程属性编码，属性相似度由其按块向量化计算
         属性：medical_department（科室）, difficulty_level（难度）, applicable_title（适用职称）
+        全量课程编码按课程目录版本缓存，课程无变化时不重复查库
         """
-        n = len(course_ids)
-        similarity_matrix = np.zeros((n, n))
-        
-        # 获取课程属性
-        courses = await MedicalCourse.filter(id__in=course_ids).all()
-        course_attrs = {c.id: c for c in courses}
-        
-        for i, cid_i in enumerate(course_ids):
-            for j, cid_j in enumerate(course_ids):
-                if i == j:
-                    similarity_matrix[i][j] = 1.0
-                elif i < j:
-                    sim = self._calculate_attribute_similarity(
-                        course_attrs.get(cid_i),
-                        course_attrs.get(cid_j)
-                    )
-                    similarity_matrix[i][j] = sim
-                    similarity_matrix[j][i] = sim
-        
-        return similarity_matrix
-    
-    def _calculate_attribute_similarity(self, course1, course2) -> float:
-        """计算两个课程之间的属性相似度"""
-        if not course1 or not course2:
-            return 0.0
-        
-        score = 0.0
-        
-        # 科室相同 +0.5
-        if course1.medical_department == course2.medical_department:
-            score += 0.5
-        
-        # 难度等级差异（差异越小越相似）
-        difficulty_diff = abs(course1.difficulty_level - course2.difficulty_level)
-        score += max(0, 0.3 - difficulty_diff * 0.1)
-        
-        # 适用职称相同 +0.2
-        if course1.applicable_title and course2.applicable_title:
-            if course1.applicable_title == course2.applicable_title:
-                score += 0.2
-        
-        return min(score, 1.0)
+        version = await get_catalog_version()
+        if self._attribute_encoding is None or self._attribute_encoding.version != version:
+            self._attribute_encoding = await CourseAttributeEncoding.load(version)
+        return self._attribute_encoding.take(course_ids)
     
     async def _generate_recommendations(
         self,
+        model: ItemSimilarityModel,
         user_id: int,
         user_courses: dict[int, float],
-        item_similarity: np.ndarray,
-        course_ids: list[int],
-        user_item_matrix: np.ndarray,
-        user_ids: list[int],
         top_n: int,
         exclude_interacted: bool
     ) -> list[dict]:
         """生成推荐列表"""
-        course_idx = {cid: idx for idx, cid in enumerate(course_ids)}
+        # 计算候选课程的推荐分数（多取已交互课程数量的候选，排除后仍足够）
+        candidates, scores = self._score(model, user_id, user_courses, top_n + len(user_courses))
+        candidate_ids = model.course_ids[candidates]
         
-        # 计算每个候选课程的推荐分数
-        candidate_scores = {}
-        
-        for candidate_id in course_ids:
-            if exclude_interacted and candidate_id in user_courses:
-                continue
-            
-            candidate_idx = course_idx[candidate_id]
-            score = 0.0
-            
-            # 基于用户交互过的课程计算加权相似度
-            for interacted_id, user_score in user_courses.items():
-                if interacted_id in course_idx:
-                    interacted_idx = course_idx[interacted_id]
-                    similarity = item_similarity[candidate_idx][interacted_idx]
-                    score += similarity * user_score
-            
-            if score > 0:
-                candidate_scores[candidate_id] = score
+        keep = scores > 0
+        if exclude_interacted:
+            keep &= ~np.isin(candidate_ids, list(user_courses.keys()))
+        candidate_ids, scores = candidate_ids[keep], scores[keep]
         
         # 按分数排序
-        sorted_candidates = sorted(candidate_scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        top_indices = np.argsort(-scores)[:top_n]
+        sorted_candidates = [(int(candidate_ids[idx]), float(scores[idx])) for idx in top_indices]
         
-        # 获取课程详情
-        recommendations = []
-        for course_id, score in sorted_candidates:
-            course = await MedicalCourse.get_or_none(id=course_id)
-            if course and course.status == 1 and course.sale_status == 1:
-                recommendations.append({
-                    "course_id": course.id,
-                    "course_code": course.course_code,
-                    "course_name": course.course_name,
-                    "medical_department": course.medical_department,
-                    "difficulty_level": course.difficulty_level,
-                    "price": float(course.price),
-                    "recommendation_score": round(score, 4),
-                    "recommendation_reason": "基于您的学习历史推荐"
-                })
+        # 批量获取课程详情，仅保留在售课程
+        scores_by_id = dict(sorted_candidates)
+        cards = await course_card_service.get_cards([course_id for course_id, _ in sorted_candidates])
+        recommendations = [
+            self._to_recommendation(card, scores_by_id[card["course_id"]], "基于您的学习历史推荐")
+            for card in cards
+            if card["status"] == 1 and card["sale_status"] == 1
+        ]
         
         # 如果推荐不足，用热门课程补充
         if len(recommendations) < top_n:
@@ -293,57 +275,62 @@ class ItemBasedCFRecommender:
         
         return recommendations
     
-    async def _get_hot_courses(self, top_n: int, exclude_ids: list[int] = None) -> list[dict]:
+    def _score(
+        self,
+        model: ItemSimilarityModel,
+        user_id: int,
+        user_courses: dict[int, float],
+        limit: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        计算候选课程推荐分数：累加用户交互课程的近邻列表
+        :return: (候选课程下标, 推荐分数)
+        """
+        return model.score(user_courses)
+    
+    async def _get_hot_courses(
+        self,
+        top_n: int,
+        exclude_ids: list[int] = None,
+        window: str = DEFAULT_WINDOW
+    ) -> list[dict]:
         """
         获取热门课程（冷启动兜底）
-        基于行为日志统计热度
+        基于行为消费者实时维护的时间衰减热度排行榜
+        :param window: 热度时间窗口（hour / day / week）
         """
         exclude_ids = exclude_ids or []
         
-        # 从MongoDB统计课程热度
-        pipeline = [
-            {"$group": {
-                "_id": "$course_id",
-                "interaction_count": {"$sum": 1},
-                "total_weight": {"$sum": "$action_value"}
-            }},
-            {"$sort": {"total_weight": -1}},
-            {"$limit": top_n + len(exclude_ids)}
-        ]
-        
-        hot_course_ids = []
-        async for doc in self.collection.aggregate(pipeline):
-            course_id = doc["_id"]
-            if course_id not in exclude_ids:
-                hot_course_ids.append(course_id)
-                if len(hot_course_ids) >= top_n:
-                    break
+        # 从Redis排行榜读取课程热度
+        hot_course_ids = await hot_course_leaderboard.top(top_n, exclude_ids, window)
         
         # 如果热度数据不足，从数据库获取最新课程
         if len(hot_course_ids) < top_n:
             query = MedicalCourse.filter(status=1, sale_status=1, is_deleted=False)
-            if exclude_ids:
+            if exclude_ids or hot_course_ids:
                 query = query.exclude(id__in=exclude_ids + hot_course_ids)
-            latest_courses = await query.order_by("-created_time").limit(top_n - len(hot_course_ids))
-            hot_course_ids.extend([c.id for c in latest_courses])
+            latest_course_ids = await query.order_by("-created_time").limit(
+                top_n - len(hot_course_ids)
+            ).values_list("id", flat=True)
+            hot_course_ids.extend(latest_course_ids)
         
-        # 获取课程详情
-        recommendations = []
-        for course_id in hot_course_ids[:top_n]:
-            course = await MedicalCourse.get_or_none(id=course_id)
-            if course:
-                recommendations.append({
-                    "course_id": course.id,
-                    "course_code": course.course_code,
-                    "course_name": course.course_name,
-                    "medical_department": course.medical_department,
-                    "difficulty_level": course.difficulty_level,
-                    "price": float(course.price),
-                    "recommendation_score": 0.0,
-                    "recommendation_reason": "热门课程"
-                })
-        
-        return recommendations
+        # 批量获取课程详情
+        cards = await course_card_service.get_cards(hot_course_ids[:top_n])
+        return [self._to_recommendation(card, 0.0, "热门课程") for card in cards]
+    
+    @staticmethod
+    def _to_recommendation(card: dict, score: float, reason: str) -> dict:
+        """课程卡片转换为推荐项"""
+        return {
+            "course_id": card["course_id"],
+            "course_code": card["course_code"],
+            "course_name": card["course_name"],
+            "medical_department": card["medical_department"],
+            "difficulty_level": card["difficulty_level"],
+            "price": card["price"],
+            "recommendation_score": round(score, 4),
+            "recommendation_reason": reason
+        }
 
 
 # 全局推荐器实例
@@ -0,0 +1,302 @@
+"""
+隐式反馈矩阵分解推荐（ALS）
+以 BEHAVIOR_WEIGHTS 加权后的交互作为隐式反馈：偏好 p = 1，置信度 c = 1 + alpha * r（仅正向交互）
+训练采用交替最小二乘，每轮用共轭梯度近似求解（对所有用户/课程同时向量化迭代）
+在线打分为用户向量与课程向量的点积，可选 hnswlib 近似最近邻索引
+"""
+import logging
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+
+from core.compute_pool import compute_pool
+from core.config import settings
+from services.recommendation import ItemBasedCFRecommender
+from services.recommendation_model import BaseRecommendationModel
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger("api")
+
+# 逐元素点积时每批处理的非零元数量，控制临时内存
+ROWWISE_DOT_CHUNK = 1 << 20
+
+
+def _rowwise_dot(left: np.ndarray, right: np.ndarray, left_rows: np.ndarray, right_rows: np.ndarray) -> np.ndarray:
+    """计算 left[left_rows[i]] · right[right_rows[i]]，分批避免一次性创建 nnz × f 的临时矩阵"""
+    result = np.empty(len(left_rows), dtype=np.float32)
+    for start in range(0, len(left_rows), ROWWISE_DOT_CHUNK):
+        end = start + ROWWISE_DOT_CHUNK
+        result[start:end] = np.einsum("ij,ij->i", left[left_rows[start:end]], right[right_rows[start:end]])
+    return result
+
+
+def _conjugate_gradient_step(
+    x: np.ndarray,
+    y: np.ndarray,
+    confidence: sparse.csr_matrix,
+    regularization: float,
+    cg_steps: int
+):
+    """
+    固定 y，用共轭梯度更新 x（原地修改）
+    每一行求解 (YᵀY + λI + Yᵀ(Cu - I)Y) x_u = Yᵀ Cu p_u
+    :param confidence: 行为 x、列为 y 的稀疏矩阵，存储 c - 1
+    """
+    gram = (y.T @ y + regularization * np.eye(y.shape[1], dtype=np.float32)).astype(np.float32)
+    rows = np.repeat(np.arange(confidence.shape[0], dtype=np.int32), np.diff(confidence.indptr))
+    cols = confidence.indices
+
+    def matvec(p: np.ndarray) -> np.ndarray:
+        weights = _rowwise_dot(p, y, rows, cols) * confidence.data
+        return p @ gram + sparse.csr_matrix((weights, cols, confidence.indptr), shape=confidence.shape) @ y
+
+    b = sparse.csr_matrix((confidence.data + 1.0, cols, confidence.indptr), shape=confidence.shape) @ y
+    r = b - matvec(x)
+    p = r.copy()
+    rs = np.einsum("ij,ij->i", r, r)
+
+    for _ in range(cg_steps):
+        ap = matvec(p)
+        denominator = np.einsum("ij,ij->i", p, ap)
+        alpha = np.divide(rs, denominator, out=np.zeros_like(rs), where=denominator > 0)
+        x += alpha[:, None] * p
+        r -= alpha[:, None] * ap
+        rs_new = np.einsum("ij,ij->i", r, r)
+        beta = np.divide(rs_new, rs, out=np.zeros_like(rs), where=rs > 0)
+        p = r + beta[:, None] * p
+        rs = rs_new
+
+
+def train_als(
+    user_item_matrix: sparse.csr_matrix,
+    factors: int,
+    regularization: float,
+    alpha: float,
+    iterations: int,
+    cg_steps: int = 3,
+    seed: int = 42
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    训练隐式反馈 ALS 模型（纯 CPU 计算，供进程池调用）
+    :param user_item_matrix: 用户-物品加权交互矩阵，非正值视为未交互
+    :return: (用户向量 m×f float32, 课程向量 n×f float32)
+    """
+    matrix = user_item_matrix.tocsr().astype(np.float32)
+    matrix.data = np.maximum(matrix.data, 0.0)
+    matrix.eliminate_zeros()
+
+    # 存储 c - 1 = alpha * r
+    confidence = matrix.copy()
+    confidence.data *= alpha
+    confidence_t = confidence.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.01, (matrix.shape[0], factors)).astype(np.float32)
+    item_factors = rng.normal(0, 0.01, (matrix.shape[1], factors)).astype(np.float32)
+
+    for _ in range(iterations):
+        _conjugate_gradient_step(user_factors, item_factors, confidence, regularization, cg_steps)
+        _conjugate_gradient_step(item_factors, user_factors, confidence_t, regularization, cg_steps)
+
+    return user_factors, item_factors
+
+
+class AlsModel(BaseRecommendationModel):
+    """
+    ALS 模型：float32 用户/课程隐向量
+    user_ids 升序存储，按二分查找定位用户，不常驻 Python 字典
+    """
+
+    def __init__(
+        self,
+        version: str,
+        course_ids: np.ndarray,
+        user_ids: np.ndarray,
+        user_factors: np.ndarray,
+        item_factors: np.ndarray,
+        regularization: float,
+        alpha: float,
+        built_at: float
+    ):
+        self.version = version
+        self.course_ids = course_ids.astype(np.int64)
+        self.user_ids = user_ids.astype(np.int64)
+        self.user_factors = user_factors.astype(np.float32)
+        self.item_factors = item_factors.astype(np.float32)
+        self.regularization = regularization
+        self.alpha = alpha
+        self.built_at = built_at
+        self.course_index = {int(cid): idx for idx, cid in enumerate(self.course_ids)}
+
+        # 折叠计算新用户向量时使用的 YᵀY + λI
+        self._gram = (
+            self.item_factors.T.astype(np.float64) @ self.item_factors
+            + regularization * np.eye(self.item_factors.shape[1])
+        )
+        self._ann_index = self._build_ann_index() if settings.recommendation_als_ann else None
+
+    @classmethod
+    def from_factors(
+        cls,
+        course_ids: list[int],
+        user_ids: list[int],
+        user_factors: np.ndarray,
+        item_factors: np.ndarray,
+        regularization: float,
+        alpha: float,
+        built_at: float
+    ) -> "AlsModel":
+        """由训练结果构建模型，用户按ID排序"""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        order = np.argsort(user_ids)
+        return cls(
+            version=cls.new_version(),
+            course_ids=np.asarray(course_ids, dtype=np.int64),
+            user_ids=user_ids[order],
+            user_factors=user_factors[order],
+            item_factors=item_factors,
+            regularization=regularization,
+            alpha=alpha,
+            built_at=built_at,
+        )
+
+    def _build_ann_index(self):
+        if hnswlib is None:
+            logger.warning("未安装 hnswlib，ALS 推荐使用精确点积检索")
+            return None
+        index = hnswlib.Index(space="ip", dim=self.item_factors.shape[1])
+        index.init_index(max_elements=len(self.course_ids), ef_construction=200, M=16)
+        index.add_items(self.item_factors, np.arange(len(self.course_ids)))
+        index.set_ef(settings.recommendation_als_ann_ef)
+        return index
+
+    def user_vector(self, user_id: int, user_courses: dict[int, float]) -> np.ndarray | None:
+        """
+        获取用户向量：训练时已有的用户直接取出，否则根据当前交互折叠计算
+        :return: 用户向量，无有效正向交互时为 None
+        """
+        pos = np.searchsorted(self.user_ids, user_id)
+        if pos < len(self.user_ids) and self.user_ids[pos] == user_id:
+            return self.user_factors[pos]
+
+        indices = []
+        weights = []
+        for course_id, weight in user_courses.items():
+            idx = self.course_index.get(course_id)
+            if idx is not None and weight > 0:
+                indices.append(idx)
+                weights.append(weight)
+        if not indices:
+            return None
+
+        y = self.item_factors[indices].astype(np.float64)
+        confidence = self.alpha * np.asarray(weights)
+        a = self._gram + (y.T * confidence) @ y
+        b = y.T @ (confidence + 1.0)
+        return np.linalg.solve(a, b).astype(np.float32)
+
+    def score(self, user_id: int, user_courses: dict[int, float], limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        计算候选课程推荐分数
+        :param limit: 需要的候选数量（仅近似索引检索时生效）
+        :return: (候选课程下标, 推荐分数)
+        """
+        vector = self.user_vector(user_id, user_courses)
+        if vector is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        if self._ann_index is not None:
+            labels, distances = self._ann_index.knn_query(vector, k=min(limit, len(self.course_ids)))
+            # 内积空间下 distance = 1 - 内积
+            return labels[0].astype(np.int32), 1.0 - distances[0]
+
+        return np.arange(len(self.course_ids), dtype=np.int32), self.item_factors @ vector
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(self.version),
+                course_ids=self.course_ids,
+                user_ids=self.user_ids,
+                user_factors=self.user_factors,
+                item_factors=self.item_factors,
+                regularization=np.array(self.regularization),
+                alpha=np.array(self.alpha),
+                built_at=np.array(self.built_at),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "AlsModel":
+        with np.load(path) as data:
+            return cls(
+                version=str(data["version"]),
+                course_ids=data["course_ids"],
+                user_ids=data["user_ids"],
+                user_factors=data["user_factors"],
+                item_factors=data["item_factors"],
+                regularization=float(data["regularization"]),
+                alpha=float(data["alpha"]),
+                built_at=float(data["built_at"]),
+            )
+
+
+class AlsRecommender(ItemBasedCFRecommender):
+    """隐式反馈矩阵分解推荐器，与 ItemBasedCFRecommender 接口一致（共享画像、热门兜底与结果缓存）"""
+
+    ALGORITHM = "als"
+    MODEL_CLASS = AlsModel
+
+    async def build_model(self) -> AlsModel | None:
+        """
+        离线训练 ALS 模型
+        :return: 模型，行为数据不足时返回 None
+        """
+        # 1. 构建用户-物品评分矩阵
+        user_item_matrix, course_ids, user_ids = await self._build_user_item_matrix()
+
+        if len(course_ids) < 2:
+            return None
+
+        # 2. 训练隐向量（CPU 密集，在独立进程中执行）
+        user_factors, item_factors = await compute_pool.run(
+            train_als,
+            user_item_matrix,
+            settings.recommendation_als_factors,
+            settings.recommendation_als_regularization,
+            settings.recommendation_als_alpha,
+            settings.recommendation_als_iterations,
+            key=("als", user_item_matrix.shape, user_item_matrix.nnz),
+            timeout=settings.recommendation_model_build_timeout
+        )
+
+        return AlsModel.from_factors(
+            course_ids=course_ids,
+            user_ids=user_ids,
+            user_factors=user_factors,
+            item_factors=item_factors,
+            regularization=settings.recommendation_als_regularization,
+            alpha=settings.recommendation_als_alpha,
+            built_at=time.time()
+        )
+
+    def _score(
+        self,
+        model: AlsModel,
+        user_id: int,
+        user_courses: dict[int, float],
+        limit: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return model.score(user_id, user_courses, limit)
+
+
+# 全局 ALS 推荐器实例
+als_recommender = AlsRecommender()
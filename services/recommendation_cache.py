@@ -0,0 +1,119 @@
+"""
+推荐结果缓存（Redis HASH）
+每个用户一个 HASH，field 为 "{algorithm}:{top_n}:{exclude_interacted}"，value 为排好序的推荐列表
+- 新鲜期内直接返回
+- 超过新鲜期或模型版本变化：先返回旧结果，同时后台重新计算（stale-while-revalidate）
+- 用户产生新行为时整个 HASH 被删除，下次请求同步重新计算
+- 同一缓存项的并发计算（缓存缺失或后台刷新）合并为一次
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+from core.config import settings
+from core.redis_client import redis_client_manager
+
+logger = logging.getLogger("api")
+
+
+class RecommendationResultCache:
+    """推荐结果缓存"""
+
+    KEY_PREFIX = "recommendation:result"
+
+    def __init__(self):
+        # 正在计算的缓存项，并发请求共享同一个计算任务
+        self._computing: dict[tuple[int, str], asyncio.Task] = {}
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    @staticmethod
+    def _field(algorithm: str, top_n: int, exclude_interacted: bool) -> str:
+        return f"{algorithm}:{top_n}:{int(exclude_interacted)}"
+
+    async def get_or_compute(
+        self,
+        algorithm: str,
+        user_id: int,
+        top_n: int,
+        exclude_interacted: bool,
+        model_version: str | None,
+        compute: Callable[[], Awaitable[list[dict]]]
+    ) -> list[dict]:
+        """
+        读取缓存的推荐结果，缺失时计算并写入
+        :param algorithm: 推荐算法名称，不同算法的结果分别缓存
+        :param model_version: 当前推荐模型版本，与缓存版本不一致视为过期
+        :param compute: 计算推荐结果的函数
+        """
+        field = self._field(algorithm, top_n, exclude_interacted)
+        redis = redis_client_manager.get_client()
+
+        cached = await redis.hget(self._key(user_id), field)
+        if cached:
+            entry = json.loads(cached)
+            fresh = (
+                time.time() - entry["created_at"] < settings.recommendation_result_cache_ttl
+                and entry["model_version"] == model_version
+            )
+            if not fresh:
+                # 先返回旧结果，后台刷新
+                self._compute_shared(user_id, field, model_version, compute)
+            return entry["items"]
+
+        return await asyncio.shield(self._compute_shared(user_id, field, model_version, compute))
+
+    async def invalidate_users(self, user_ids: list[int]):
+        """用户产生新行为后删除其全部缓存结果"""
+        if not user_ids:
+            return
+        redis = redis_client_manager.get_client()
+        await redis.delete(*[self._key(user_id) for user_id in user_ids])
+
+    async def _store(self, user_id: int, field: str, model_version: str | None, items: list[dict]):
+        key = self._key(user_id)
+        entry = {"model_version": model_version, "created_at": time.time(), "items": items}
+        redis = redis_client_manager.get_client()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, field, json.dumps(entry, ensure_ascii=False))
+            # 过期结果最多保留 stale_ttl，超过后必须同步重新计算
+            pipe.expire(key, settings.recommendation_result_cache_stale_ttl)
+            await pipe.execute()
+
+    def _compute_shared(
+        self,
+        user_id: int,
+        field: str,
+        model_version: str | None,
+        compute: Callable[[], Awaitable[list[dict]]]
+    ) -> asyncio.Task:
+        """计算并写入缓存，同一缓存项已在计算时复用该任务"""
+        compute_key = (user_id, field)
+        task = self._computing.get(compute_key)
+        if task is not None:
+            return task
+
+        async def compute_and_store() -> list[dict]:
+            items = await compute()
+            try:
+                await self._store(user_id, field, model_version, items)
+            except Exception as e:
+                logger.error(f"写入推荐结果缓存失败: user_id={user_id}, {e}")
+            return items
+
+        task = asyncio.create_task(compute_and_store())
+        self._computing[compute_key] = task
+
+        def on_done(t: asyncio.Task):
+            self._computing.pop(compute_key, None)
+            if not t.cancelled() and t.exception():
+                logger.error(f"计算推荐结果失败: user_id={user_id}, {t.exception()}")
+
+        task.add_done_callback(on_done)
+        return task
+
+
+recommendation_result_cache = RecommendationResultCache()
@@ -0,0 +1,376 @@
+"""
+推荐模型离线构建与热加载
+- 离线：聚合行为日志 -> 稀疏用户-物品矩阵 -> 混合相似度 Top-K 近邻索引，持久化为带版本号的模型文件
+- 触发：定时重建 + 累计 N 条新行为后重建，多进程间通过 Redis 锁保证同一时刻只有一个构建者
+- 在线：各进程加载最新版本模型，整体替换引用实现原子热切换，请求只累加交互课程的近邻列表
+"""
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from core.config import settings
+from core.redis_client import redis_client_manager
+from services.course_attribute import CourseAttributeEncoding
+
+logger = logging.getLogger("api")
+
+MODEL_FILE_PREFIX = "model_"
+MODEL_FILE_SUFFIX = ".npz"
+LATEST_POINTER_FILE = "LATEST"
+
+
+def compute_hybrid_top_k(
+    user_item_matrix: sparse.csr_matrix,
+    attributes: CourseAttributeEncoding,
+    k: int,
+    block_size: int,
+    behavior_weight: float,
+    attribute_weight: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    计算混合相似度（行为 + 属性）并为每个课程保留 top-k 近邻
+    按行分块计算，内存占用为 O(块大小 × n + n × k)；纯 CPU 计算，供进程池调用
+    :param user_item_matrix: 用户-物品稀疏评分矩阵
+    :param attributes: 与矩阵列对齐的课程属性编码
+    :return: (近邻下标矩阵 n×k int32, 近邻相似度矩阵 n×k float32)
+    """
+    # 物品-用户矩阵按行 L2 归一化，余弦相似度即为行向量内积
+    item_matrix = normalize(user_item_matrix.T.tocsr(), norm="l2", axis=1)
+    item_matrix_t = item_matrix.T.tocsc()
+
+    n = item_matrix.shape[0]
+    neighbour_indices = np.empty((n, k), dtype=np.int32)
+    neighbour_scores = np.empty((n, k), dtype=np.float32)
+
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+
+        # 混合两种相似度（仅当前块）
+        behavior_block = (item_matrix[start:end] @ item_matrix_t).toarray()
+        hybrid_block = (
+            behavior_weight * behavior_block +
+            attribute_weight * attributes.similarity_block(start, end)
+        ).astype(np.float32)
+
+        # 排除自身
+        hybrid_block[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        # 取 top-k 近邻
+        top = np.argpartition(-hybrid_block, k - 1, axis=1)[:, :k]
+        neighbour_indices[start:end] = top
+        neighbour_scores[start:end] = np.take_along_axis(hybrid_block, top, axis=1)
+
+    return neighbour_indices, neighbour_scores
+
+
+class BaseRecommendationModel(ABC):
+    """
+    推荐模型抽象基类（只读，更新时整体替换）
+    子类需提供 version、built_at、course_ids 属性
+    """
+    version: str
+    built_at: float
+    course_ids: np.ndarray
+
+    @classmethod
+    def new_version(cls) -> str:
+        """生成模型版本号（时间戳，保证字典序即时间序）"""
+        return datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+    @abstractmethod
+    def save(self, path: str):
+        """保存模型（先写临时文件再原子替换，避免读到半个文件）"""
+        pass
+
+    @classmethod
+    @abstractmethod
+    def load(cls, path: str) -> "BaseRecommendationModel":
+        """从文件加载模型"""
+        pass
+
+
+class ItemSimilarityModel(BaseRecommendationModel):
+    """
+    物品相似度模型
+    以紧凑数组保存每个课程的 Top-K 近邻（类似 CSR）：
+    - neighbour_offsets: int32[n + 1]，第 i 个课程的近邻位于 [offsets[i], offsets[i + 1])
+    - neighbour_indices: int32[nnz]，近邻课程下标，按相似度降序
+    - neighbour_scores: float32[nnz]，对应的混合相似度
+    """
+
+    def __init__(
+        self,
+        version: str,
+        course_ids: np.ndarray,
+        neighbour_offsets: np.ndarray,
+        neighbour_indices: np.ndarray,
+        neighbour_scores: np.ndarray,
+        built_at: float
+    ):
+        self.version = version
+        self.course_ids = course_ids.astype(np.int64)
+        self.neighbour_offsets = neighbour_offsets.astype(np.int32)
+        self.neighbour_indices = neighbour_indices.astype(np.int32)
+        self.neighbour_scores = neighbour_scores.astype(np.float32)
+        self.built_at = built_at
+        self.course_index = {int(cid): idx for idx, cid in enumerate(self.course_ids)}
+
+    @classmethod
+    def from_top_k(
+        cls,
+        course_ids: np.ndarray,
+        top_k_indices: np.ndarray,
+        top_k_scores: np.ndarray,
+        min_similarity: float = 0.0
+    ) -> "ItemSimilarityModel":
+        """
+        由 n×k 的近邻矩阵构建模型：每行按相似度降序排列，并截断相似度不高于 min_similarity 的近邻
+        :param course_ids: 课程ID数组
+        :param top_k_indices: 近邻下标矩阵 n×k
+        :param top_k_scores: 近邻相似度矩阵 n×k
+        :param min_similarity: 相似度下限
+        """
+        order = np.argsort(-top_k_scores, axis=1)
+        sorted_indices = np.take_along_axis(top_k_indices, order, axis=1)
+        sorted_scores = np.take_along_axis(top_k_scores, order, axis=1)
+
+        keep = sorted_scores > min_similarity
+        offsets = np.zeros(len(course_ids) + 1, dtype=np.int32)
+        np.cumsum(keep.sum(axis=1), out=offsets[1:])
+
+        return cls(
+            version=cls.new_version(),
+            course_ids=course_ids,
+            neighbour_offsets=offsets,
+            neighbour_indices=sorted_indices[keep],
+            neighbour_scores=sorted_scores[keep],
+            built_at=time.time(),
+        )
+
+    def score(self, user_courses: dict[int, float]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        累加用户交互过的每个课程的近邻列表，计算候选课程推荐分数
+        复杂度 O(|交互课程| × K)，与课程总数无关
+        :param user_courses: {course_id: weighted_score}
+        :return: (候选课程下标, 推荐分数)
+        """
+        candidate_chunks = []
+        score_chunks = []
+        for course_id, weight in user_courses.items():
+            idx = self.course_index.get(course_id)
+            if idx is None:
+                continue
+            start, end = self.neighbour_offsets[idx], self.neighbour_offsets[idx + 1]
+            candidate_chunks.append(self.neighbour_indices[start:end])
+            score_chunks.append(self.neighbour_scores[start:end] * weight)
+
+        if not candidate_chunks:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        candidates, inverse = np.unique(np.concatenate(candidate_chunks), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_chunks))
+        return candidates, scores
+
+    def save(self, path: str):
+        """保存模型（先写临时文件再原子替换，避免读到半个文件）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(self.version),
+                course_ids=self.course_ids,
+                neighbour_offsets=self.neighbour_offsets,
+                neighbour_indices=self.neighbour_indices,
+                neighbour_scores=self.neighbour_scores,
+                built_at=np.array(self.built_at),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ItemSimilarityModel":
+        """从文件加载模型"""
+        with np.load(path) as data:
+            return cls(
+                version=str(data["version"]),
+                course_ids=data["course_ids"],
+                neighbour_offsets=data["neighbour_offsets"],
+                neighbour_indices=data["neighbour_indices"],
+                neighbour_scores=data["neighbour_scores"],
+                built_at=float(data["built_at"]),
+            )
+
+
+class RecommendationModelManager:
+    """推荐模型管理器：负责构建、持久化、版本检查与热切换"""
+
+    BUILD_LOCK_TIMEOUT = 60 * 10
+
+    def __init__(
+        self,
+        builder: Callable[[], Awaitable[Optional[BaseRecommendationModel]]],
+        model_cls: type[BaseRecommendationModel] = ItemSimilarityModel,
+        name: str = "item_cf"
+    ):
+        """
+        :param builder: 构建模型的协程函数
+        :param model_cls: 模型类，用于从文件加载
+        :param name: 模型名称，决定模型文件子目录和构建锁
+        """
+        self._builder = builder
+        self._model_cls = model_cls
+        self._name = name
+        self._model: BaseRecommendationModel | None = None
+        self._pending_events = 0
+        self._build_task: asyncio.Task | None = None
+        self._schedule_task: asyncio.Task | None = None
+
+    @property
+    def current(self) -> BaseRecommendationModel | None:
+        """当前生效的模型（调用方应先取到局部变量再使用）"""
+        return self._model
+
+    @property
+    def model_dir(self) -> str:
+        return os.path.join(settings.recommendation_model_dir, self._name)
+
+    @property
+    def build_lock_key(self) -> str:
+        return f"recommendation:model:{self._name}:build_lock"
+
+    async def start(self):
+        """启动：加载最新模型，无模型时立即构建，并开启定时任务"""
+        try:
+            await self.reload()
+        except Exception as e:
+            logger.error(f"加载推荐模型失败: {e}")
+        if self._model is None:
+            self.trigger_rebuild()
+        self._schedule_task = asyncio.create_task(self._schedule_loop())
+
+    async def stop(self):
+        """停止定时任务与正在进行的构建"""
+        for task in (self._schedule_task, self._build_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._schedule_task = None
+        self._build_task = None
+
+    def record_events(self, count: int = 1):
+        """
+        记录新行为事件数，累计达到阈值时触发重建
+        :param count: 新增事件数
+        """
+        self._pending_events += count
+        if self._pending_events >= settings.recommendation_model_rebuild_events:
+            self.trigger_rebuild()
+
+    def trigger_rebuild(self) -> asyncio.Task:
+        """在后台触发一次重建（已有构建任务时直接复用）"""
+        if self._build_task is None or self._build_task.done():
+            self._build_task = asyncio.create_task(self.rebuild())
+        return self._build_task
+
+    async def wait_for_model(self, timeout: float) -> BaseRecommendationModel | None:
+        """
+        触发构建并限时等待模型就绪（供在线请求在无模型时使用）
+        :param timeout: 最长等待时间（秒），超时后构建继续在后台进行
+        :return: 当前模型，超时或构建失败时为 None
+        """
+        task = self.trigger_rebuild()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._model
+
+    async def rebuild(self):
+        """构建新模型并持久化，成功后热切换"""
+        redis = redis_client_manager.get_client()
+        lock = redis.lock(self.build_lock_key, timeout=self.BUILD_LOCK_TIMEOUT, blocking_timeout=0)
+        if not await lock.acquire(blocking=False):
+            logger.info("其他进程正在构建推荐模型，跳过本次构建")
+            return
+
+        try:
+            self._pending_events = 0
+            start_time = time.time()
+            model = await self._builder()
+            if model is None:
+                logger.info("行为数据不足，跳过推荐模型构建")
+                return
+
+            await asyncio.to_thread(self._persist, model)
+            self._swap(model)
+            logger.info(f"推荐模型构建完成: name={self._name}, version={model.version}, "
+                        f"courses={len(model.course_ids)}, 耗时={time.time() - start_time:.2f}s")
+        except Exception as e:
+            logger.error(f"构建推荐模型失败: {e}")
+        finally:
+            try:
+                await lock.release()
+            except Exception:
+                pass
+
+    async def reload(self):
+        """检查最新版本，有更新时加载并热切换"""
+        version = await asyncio.to_thread(self._read_latest_version)
+        if not version or (self._model and self._model.version == version):
+            return
+        model = await asyncio.to_thread(self._model_cls.load, self._model_path(version))
+        self._swap(model)
+        logger.info(f"推荐模型已加载: name={self._name}, version={version}")
+
+    def _swap(self, model: BaseRecommendationModel):
+        """原子替换模型引用，进行中的请求仍使用旧模型"""
+        self._model = model
+
+    async def _schedule_loop(self):
+        """定时检查新版本，并在模型过期时触发重建"""
+        while True:
+            await asyncio.sleep(settings.recommendation_model_reload_interval)
+            try:
+                await self.reload()
+                model = self._model
+                if model is None or time.time() - model.built_at >= settings.recommendation_model_rebuild_interval:
+                    self.trigger_rebuild()
+            except Exception as e:
+                logger.error(f"推荐模型定时任务异常: {e}")
+
+    def _model_path(self, version: str) -> str:
+        return os.path.join(self.model_dir, f"{MODEL_FILE_PREFIX}{version}{MODEL_FILE_SUFFIX}")
+
+    def _read_latest_version(self) -> str | None:
+        pointer = os.path.join(self.model_dir, LATEST_POINTER_FILE)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, encoding="utf-8") as f:
+            return f.read().strip() or None
+
+    def _persist(self, model: BaseRecommendationModel):
+        """写入模型文件、更新 LATEST 指针并清理旧版本"""
+        os.makedirs(self.model_dir, exist_ok=True)
+        model.save(self._model_path(model.version))
+
+        pointer = os.path.join(self.model_dir, LATEST_POINTER_FILE)
+        with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+            f.write(model.version)
+        os.replace(f"{pointer}.tmp", pointer)
+
+        files = sorted(
+            name for name in os.listdir(self.model_dir)
+            if name.startswith(MODEL_FILE_PREFIX) and name.endswith(MODEL_FILE_SUFFIX)
+        )
+        for name in files[:-settings.recommendation_model_keep_versions]:
+            os.remove(os.path.join(self.model_dir, name))
@@ -0,0 +1,37 @@
+from typing import Dict
+
+from core.config import settings
+from services.recommendation import ItemBasedCFRecommender, item_cf_recommender
+from services.recommendation_als import als_recommender
+
+
+class RecommenderFactory:
+    """
+    推荐算法工厂
+    """
+    _recommenders: Dict[str, ItemBasedCFRecommender] = {
+        ItemBasedCFRecommender.ALGORITHM: item_cf_recommender,
+        als_recommender.ALGORITHM: als_recommender,
+    }
+
+    @classmethod
+    def get_recommender(cls, algorithm: str | None = None) -> ItemBasedCFRecommender:
+        """
+        获取推荐器，未指定算法时使用配置的默认算法
+        仅启用（维护模型）的算法可用
+        """
+        algorithm = algorithm or settings.recommendation_algorithm
+        recommender = cls._recommenders.get(algorithm)
+        if not recommender:
+            raise ValueError(f"不支持的推荐算法: {algorithm}")
+        if algorithm not in settings.recommendation_engines:
+            raise ValueError(f"推荐算法 {algorithm} 未启用")
+        return recommender
+
+    @classmethod
+    def active_recommenders(cls) -> list[ItemBasedCFRecommender]:
+        """已启用的推荐器（需要加载、定时重建模型）"""
+        return [
+            recommender for algorithm, recommender in cls._recommenders.items()
+            if algorithm in settings.recommendation_engines
+        ]
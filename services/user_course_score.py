@@ -0,0 +1,289 @@
+"""
+用户-课程评分汇总（MongoDB user_course_score 集合）
+每个 (user_id, course_id) 一条文档，行为消费者写入日志时增量累加：
+    score        时间衰减后的行为权重（见下）
+    weight       行为权重之和（不衰减）
+    actions.*    各行为类型的次数
+推荐器构建矩阵、重建用户画像都直接读取汇总结果，扫描量只与用户-课程对数量有关，不随行为日志增长。
+
+时间衰减采用前向衰减（forward decay），相对固定的基准时间 epoch：
+    score += action_value * 2 ^ ((event_time - epoch) / half_life)
+event_time 为行为发生时间 created_time（缺失或无法解析时取写入时间 inserted_time，且不晚于写入时间），
+重投、积压后才写入的行为仍按发生时间衰减。
+读取时统一乘以 2 ^ (-(now - epoch) / half_life) 即得到当前时刻的衰减评分，
+已有文档无需随时间重写。放大系数随时间指数增长，启动时检查基准时间到一年后不超过
+MAX_DECAY_HALF_LIVES 个半衰期（见 validate_decay），否则需将基准时间调整到近期。
+基准时间和半衰期修改后需执行回填重建：
+    python -m services.user_course_score --force
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from core.config import settings
+from core.mongodb_client import mongodb_client_manager
+from core.redis_client import redis_client_manager
+from models.schemas.behavior import ActionType
+
+logger = logging.getLogger("api")
+
+# MongoDB集合名称
+USER_COURSE_SCORE_COLLECTION = "user_course_score"
+
+
+class UserCourseScoreRollup:
+    """用户-课程评分汇总"""
+
+    REBUILD_LOCK_KEY = "recommendation:user_course_score:rebuild_lock"
+    # 回填完成标记
+    READY_KEY = "recommendation:user_course_score:ready"
+    REBUILD_LOCK_TIMEOUT = 60 * 30
+    # 其他进程回填期间检查是否完成的间隔（秒）
+    REBUILD_WAIT_INTERVAL = 5.0
+    # 放大系数的最大指数（float 上限约 2^1024，为评分累加和换算留出余量）
+    MAX_DECAY_HALF_LIVES = 512
+    # 启动检查时基准时间之后至少可用的天数
+    DECAY_HEADROOM_DAYS = 365
+
+    def __init__(self):
+        self._collection = None
+
+    @property
+    def collection(self):
+        """获取MongoDB集合"""
+        if self._collection is None:
+            self._collection = mongodb_client_manager.get_collection(USER_COURSE_SCORE_COLLECTION)
+        return self._collection
+
+    @staticmethod
+    def _half_life_seconds() -> float:
+        return settings.recommendation_decay_half_life_days * 60 * 60 * 24
+
+    def validate_decay(self, now: datetime | None = None):
+        """
+        检查衰减参数：基准时间到 now 之后 DECAY_HEADROOM_DAYS 天的半衰期数不超过 MAX_DECAY_HALF_LIVES，
+        否则放大系数会在此期间浮点溢出（应用启动和回填前调用）
+        :raises ValueError: 半衰期过短或基准时间过早
+        """
+        half_life = self._half_life_seconds()
+        if half_life <= 0:
+            return
+        horizon = (now or datetime.now()) + timedelta(days=self.DECAY_HEADROOM_DAYS)
+        half_lives = (horizon - settings.recommendation_decay_epoch).total_seconds() / half_life
+        if half_lives > self.MAX_DECAY_HALF_LIVES:
+            raise ValueError(
+                f"行为评分衰减参数会导致浮点溢出：基准时间 {settings.recommendation_decay_epoch} "
+                f"到 {horizon:%Y-%m-%d} 共 {half_lives:.0f} 个半衰期（上限 {self.MAX_DECAY_HALF_LIVES}），"
+                f"请将 recommendation_decay_epoch 调整到近期或增大半衰期，并执行 --force 回填"
+            )
+
+    def weight_factor(self, event_time: datetime) -> float:
+        """
+        行为发生时刻相对基准时间的放大系数，<= 0 的半衰期表示不衰减
+        :raises ValueError: 超过 MAX_DECAY_HALF_LIVES 个半衰期
+        """
+        half_life = self._half_life_seconds()
+        if half_life <= 0:
+            return 1.0
+        exponent = (event_time - settings.recommendation_decay_epoch).total_seconds() / half_life
+        if exponent > self.MAX_DECAY_HALF_LIVES:
+            raise ValueError(f"行为时间距衰减基准时间超过 {self.MAX_DECAY_HALF_LIVES} 个半衰期，请调整基准时间后回填")
+        return 2 ** exponent
+
+    def read_factor(self, now: float | None = None) -> float:
+        """汇总评分换算为当前时刻衰减评分的系数"""
+        half_life = self._half_life_seconds()
+        if half_life <= 0:
+            return 1.0
+        elapsed = (now or time.time()) - settings.recommendation_decay_epoch.timestamp()
+        return 2 ** (-elapsed / half_life)
+
+    @staticmethod
+    def event_time(event: dict) -> datetime:
+        """
+        行为发生时间：created_time（消息解码后为字符串），缺失或无法解析时取写入时间；
+        晚于写入时间（客户端时钟偏差）时按写入时间计
+        """
+        inserted_time = event["inserted_time"]
+        created_time = event.get("created_time")
+        if isinstance(created_time, str):
+            try:
+                created_time = datetime.fromisoformat(created_time)
+            except ValueError:
+                created_time = None
+        if not isinstance(created_time, datetime):
+            return inserted_time
+        if created_time.tzinfo is not None:
+            created_time = created_time.astimezone().replace(tzinfo=None)
+        return min(created_time, inserted_time)
+
+    async def record(self, events: list[dict]):
+        """
+        累加行为评分（同一用户-课程对合并为一次更新）
+        :param events: 行为日志，需包含 user_id, course_id, action_type, action_value, inserted_time，可选 created_time
+        """
+        increments: dict[tuple[int, int], dict[str, float]] = {}
+        latest: dict[tuple[int, int], datetime] = {}
+        for event in events:
+            pair = (event["user_id"], event["course_id"])
+            event_time = self.event_time(event)
+            weight = event.get("action_value") or 0.0
+
+            inc = increments.setdefault(pair, {"score": 0.0, "weight": 0.0})
+            inc["score"] += weight * self.weight_factor(event_time)
+            inc["weight"] += weight
+            action_field = f"actions.{event['action_type']}"
+            inc[action_field] = inc.get(action_field, 0) + 1
+            latest[pair] = max(latest.get(pair, event_time), event_time)
+
+        if not increments:
+            return
+
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "course_id": course_id},
+                {"$inc": inc, "$max": {"updated_time": latest[(user_id, course_id)]}},
+                upsert=True
+            )
+            for (user_id, course_id), inc in increments.items()
+        ], ordered=False)
+
+    async def get_user_scores(self, user_id: int) -> dict[int, float]:
+        """
+        获取用户交互过的课程及当前时刻的衰减评分
+        :return: {course_id: score}
+        """
+        decay = self.read_factor()
+        cursor = self.collection.find({"user_id": user_id}, {"_id": 0, "course_id": 1, "score": 1})
+        return {doc["course_id"]: (doc["score"] or 0.0) * decay async for doc in cursor}
+
+    async def backfill(self, log_store, force: bool = False) -> bool:
+        """
+        从原始行为日志回填汇总（首次部署或修改衰减参数后执行）
+        在 MongoDB 内跨分区聚合并 $merge 覆盖写回，不经过应用进程；完成后写入就绪标记。
+        回填期间消费者写入的增量可能被覆盖，应用启动时会等汇总就绪后再启动消费者（见 wait_until_ready），
+        强制重建（CLI）会清除就绪标记，建议在低峰期执行。
+        已归档分区的行为不再参与回填，强制重建会丢失这部分历史评分
+        :param log_store: 用户行为日志分区存储
+        :param force: 已完成过回填时是否仍然重建
+        :return: 汇总是否已就绪（其他进程正在回填时返回 False）
+        """
+        self.validate_decay()
+        redis = redis_client_manager.get_client()
+        if not force and await redis.exists(self.READY_KEY):
+            return True
+
+        lock = redis.lock(self.REBUILD_LOCK_KEY, timeout=self.REBUILD_LOCK_TIMEOUT, blocking_timeout=0)
+        if not await lock.acquire(blocking=False):
+            return False
+
+        try:
+            if force:
+                await redis.delete(self.READY_KEY)
+            elif await redis.exists(self.READY_KEY):
+                return True
+
+            # 回填耗时可能超过锁的有效期，执行期间定期续期，避免其他进程重复回填
+            merge_task = asyncio.create_task(self._merge_from_logs(log_store))
+            try:
+                while True:
+                    done, _ = await asyncio.wait({merge_task}, timeout=self.REBUILD_LOCK_TIMEOUT / 3)
+                    if done:
+                        merge_task.result()
+                        break
+                    await lock.extend(self.REBUILD_LOCK_TIMEOUT, replace_ttl=True)
+            finally:
+                merge_task.cancel()
+
+            await redis.set(self.READY_KEY, int(time.time()))
+            logger.info("用户-课程评分汇总已从行为日志回填")
+            return True
+        finally:
+            try:
+                await lock.release()
+            except Exception:
+                pass
+
+    async def wait_until_ready(self, log_store):
+        """
+        等待汇总就绪：未回填时由取得锁的进程回填，其他进程等待其完成
+        :param log_store: 用户行为日志分区存储
+        """
+        while not await self.backfill(log_store):
+            await asyncio.sleep(self.REBUILD_WAIT_INTERVAL)
+
+    async def _merge_from_logs(self, log_store):
+        half_life_ms = self._half_life_seconds() * 1000
+        if half_life_ms > 0:
+            factor = {"$pow": [2, {"$divide": [
+                {"$subtract": ["$event_time", settings.recommendation_decay_epoch]}, half_life_ms
+            ]}]}
+        else:
+            factor = 1.0
+
+        pipeline = [
+            # 行为发生时间，与 event_time() 一致
+            {"$set": {"event_time": {"$min": [
+                {"$convert": {
+                    "input": "$created_time", "to": "date", "onError": "$inserted_time", "onNull": "$inserted_time"
+                }},
+                "$inserted_time"
+            ]}}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "course_id": "$course_id"},
+                "score": {"$sum": {"$multiply": [{"$ifNull": ["$action_value", 0]}, factor]}},
+                "weight": {"$sum": {"$ifNull": ["$action_value", 0]}},
+                **{
+                    action.value: {"$sum": {"$cond": [{"$eq": ["$action_type", action.value]}, 1, 0]}}
+                    for action in ActionType
+                },
+                "updated_time": {"$max": "$event_time"}
+            }},
+            {"$project": {
+                "_id": 0,
+                "user_id": "$_id.user_id",
+                "course_id": "$_id.course_id",
+                "score": 1,
+                "weight": 1,
+                # 未出现的行为类型不写入计数，与增量 $inc 的文档结构一致
+                "actions": {"$arrayToObject": {"$filter": {
+                    "input": [{"k": action.value, "v": f"${action.value}"} for action in ActionType],
+                    "cond": {"$gt": ["$$this.v", 0]}
+                }}},
+                "updated_time": 1
+            }},
+            {"$merge": {
+                "into": USER_COURSE_SCORE_COLLECTION,
+                "on": ["user_id", "course_id"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]
+        async for _ in log_store.aggregate(pipeline):
+            pass
+
+
+user_course_score_rollup = UserCourseScoreRollup()
+
+
+async def _run_backfill(force: bool):
+    from services.behavior_log_store import behavior_log_store
+
+    await redis_client_manager.init_pool()
+    await mongodb_client_manager.init_client()
+    try:
+        if not await user_course_score_rollup.backfill(behavior_log_store, force=force):
+            logger.warning("其他进程正在回填用户-课程评分汇总，本次未执行")
+    finally:
+        await mongodb_client_manager.close_client()
+        await redis_client_manager.close_pool()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="从行为日志回填用户-课程评分汇总")
+    parser.add_argument("--force", action="store_true", help="汇总集合非空时仍然重建")
+    asyncio.run(_run_backfill(parser.parse_args().force))
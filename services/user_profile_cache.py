@@ -0,0 +1,97 @@
+"""
+用户交互画像缓存（Redis HASH）
+每个用户一个 HASH：field 为课程ID，value 为该课程的累计行为权重
+行为消费者写入日志时增量累加；缓存缺失时从 MongoDB 聚合重建
+"""
+import logging
+from typing import Awaitable, Callable
+
+from core.config import settings
+from core.redis_client import redis_client_manager
+
+logger = logging.getLogger("api")
+
+# 仅在画像已存在时累加，避免在缺失时写出不完整的画像
+# KEYS[1]: 画像 HASH  ARGV: course_id, weight 成对出现
+INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+class UserProfileCache:
+    """用户交互画像缓存"""
+
+    KEY_PREFIX = "recommendation:user_profile"
+    # 标记字段：画像已构建（无交互记录的用户也会缓存为空画像）
+    MARKER_FIELD = "_built"
+
+    def __init__(self):
+        self._script = None
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    def _get_script(self, redis):
+        if self._script is None:
+            self._script = redis.register_script(INCREMENT_SCRIPT)
+        return self._script
+
+    async def get(
+        self,
+        user_id: int,
+        loader: Callable[[int], Awaitable[dict[int, float]]]
+    ) -> dict[int, float]:
+        """
+        获取用户交互过的课程及其评分，缓存缺失时调用 loader 从 MongoDB 重建
+        :param user_id: 用户ID
+        :param loader: 重建函数，返回 {course_id: weighted_score}
+        :return: {course_id: weighted_score}
+        """
+        redis = redis_client_manager.get_client()
+        profile = await redis.hgetall(self._key(user_id))
+        if profile:
+            return {
+                int(course_id): float(weight)
+                for course_id, weight in profile.items()
+                if course_id != self.MARKER_FIELD
+            }
+
+        user_courses = await loader(user_id)
+        await self._store(user_id, user_courses)
+        return user_courses
+
+    async def record(self, user_course_weights: dict[int, dict[int, float]]):
+        """
+        增量累加用户画像（仅更新已缓存的用户）
+        :param user_course_weights: {user_id: {course_id: 行为权重之和}}
+        """
+        if not user_course_weights:
+            return
+        redis = redis_client_manager.get_client()
+        script = self._get_script(redis)
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id, course_weights in user_course_weights.items():
+                args = []
+                for course_id, weight in course_weights.items():
+                    args.extend([course_id, weight])
+                await script(keys=[self._key(user_id)], args=args, client=pipe)
+            await pipe.execute()
+
+    async def _store(self, user_id: int, user_courses: dict[int, float]):
+        """整体写入用户画像，过期后重新从 MongoDB 重建以纠正偏差"""
+        key = self._key(user_id)
+        redis = redis_client_manager.get_client()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={self.MARKER_FIELD: 1, **user_courses})
+            pipe.expire(key, settings.user_profile_cache_ttl)
+            await pipe.execute()
+
+
+user_profile_cache = UserProfileCache()
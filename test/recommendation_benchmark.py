@@ -0,0 +1,309 @@
+"""
+推荐器基准测试
+生成合成的用户行为数据（课程热度服从 Zipf 长尾分布），分阶段测量：
+    matrix     -> 读取用户-课程评分汇总并构建稀疏用户-物品矩阵（ItemBasedCFRecommender._build_user_item_matrix）
+    similarity -> 混合相似度 + Top-K 近邻（compute_hybrid_top_k）
+    index      -> 截断并压缩为近邻索引（ItemSimilarityModel.from_top_k）
+    scoring    -> 在线打分（ItemSimilarityModel.score），统计吞吐
+输出每个阶段的耗时、峰值内存，可与基线结果比较，退化超过容忍度时以非零状态码退出。
+
+用法（在项目根目录执行）：
+    python -m test.recommendation_benchmark --events 10000,100000,1000000
+    python -m test.recommendation_benchmark --events 100000 --output bench.json
+    python -m test.recommendation_benchmark --events 100000 --baseline bench.json --tolerance 0.2
+    python -m test.recommendation_benchmark --events 100000 --mongo-url mongodb://localhost:27017
+默认使用内存中的 MongoDB 替身；指定 --mongo-url 时写入本地 MongoDB 的独立数据库并走真实查询。
+"""
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from core.config import settings
+from models.schemas.behavior import ActionType
+from services.course_attribute import CourseAttributeEncoding
+from services.recommendation import ItemBasedCFRecommender
+from services.recommendation_model import ItemSimilarityModel, compute_hybrid_top_k
+from services.user_course_score import USER_COURSE_SCORE_COLLECTION
+
+BENCHMARK_DATABASE = "medical_pulse_benchmark"
+
+# 与基线比较时忽略的绝对波动（过小的阶段受噪声影响大）
+MIN_DELTA = {"seconds": 0.05, "peak_mb": 1.0}
+
+# 行为类型分布
+ACTION_PROBABILITIES = {
+    ActionType.VIEW.value: 0.70,
+    ActionType.FAVORITE.value: 0.10,
+    ActionType.UNFAVORITE.value: 0.02,
+    ActionType.PURCHASE.value: 0.05,
+    ActionType.STUDY.value: 0.10,
+    ActionType.RATE.value: 0.03,
+}
+
+
+def generate_events(n_events: int, n_users: int, n_courses: int, skew: float, seed: int) -> dict[str, np.ndarray]:
+    """
+    生成合成行为数据（行为时间均匀分布在最近一年）
+    :param skew: Zipf 指数，越大热门课程越集中
+    :return: {"user_id", "course_id", "action_type", "action_value", "timestamp"} 列式数组
+    """
+    rng = np.random.default_rng(seed)
+
+    course_popularity = 1.0 / np.arange(1, n_courses + 1) ** skew
+    course_popularity /= course_popularity.sum()
+    user_activity = 1.0 / np.arange(1, n_users + 1) ** (skew / 2)
+    user_activity /= user_activity.sum()
+
+    actions = list(ACTION_PROBABILITIES)
+    action_codes = rng.choice(len(actions), size=n_events, p=list(ACTION_PROBABILITIES.values()))
+    weights = np.array([ItemBasedCFRecommender.BEHAVIOR_WEIGHTS[a] for a in actions], dtype=np.float32)
+
+    return {
+        "user_id": rng.choice(n_users, size=n_events, p=user_activity) + 1,
+        "course_id": rng.choice(n_courses, size=n_events, p=course_popularity) + 1,
+        "action_type": np.array(actions)[action_codes],
+        "action_value": weights[action_codes],
+        "timestamp": time.time() - rng.uniform(0, 365 * 24 * 3600, n_events),
+    }
+
+
+def generate_attributes(n_courses: int, seed: int) -> CourseAttributeEncoding:
+    """生成合成课程属性编码"""
+    rng = np.random.default_rng(seed)
+    return CourseAttributeEncoding(
+        version="benchmark",
+        course_ids=np.arange(1, n_courses + 1),
+        department_codes=rng.integers(0, 20, n_courses),
+        difficulty_levels=rng.integers(1, 5, n_courses),
+        title_codes=rng.integers(-1, 6, n_courses),
+    )
+
+
+def rollup_events(events: dict[str, np.ndarray]) -> list[dict]:
+    """
+    按 (user_id, course_id) 汇总前向衰减评分、权重与行为次数，与 UserCourseScoreRollup.record 的结果一致
+    :return: user_course_score 文档列表
+    """
+    half_life = settings.recommendation_decay_half_life_days * 24 * 3600
+    if half_life > 0:
+        factors = 2 ** ((events["timestamp"] - settings.recommendation_decay_epoch.timestamp()) / half_life)
+    else:
+        factors = np.ones(len(events["timestamp"]))
+
+    n_courses = int(events["course_id"].max()) + 1
+    pair_keys = events["user_id"].astype(np.int64) * n_courses + events["course_id"]
+    pairs, inverse = np.unique(pair_keys, return_inverse=True)
+    scores = np.bincount(inverse, weights=events["action_value"] * factors)
+    weights = np.bincount(inverse, weights=events["action_value"])
+    action_counts = {
+        action: np.bincount(inverse[events["action_type"] == action], minlength=len(pairs)).tolist()
+        for action in ACTION_PROBABILITIES
+    }
+    return [
+        {
+            "user_id": pair // n_courses,
+            "course_id": pair % n_courses,
+            "score": score,
+            "weight": weight,
+            "actions": {action: counts[i] for action, counts in action_counts.items() if counts[i]},
+        }
+        for i, (pair, score, weight) in enumerate(zip(pairs.tolist(), scores.tolist(), weights.tolist()))
+    ]
+
+
+class InMemoryScoreCollection:
+    """
+    MongoDB 用户-课程评分汇总集合的内存替身
+    仅实现推荐器构建矩阵所用的全量 find
+    """
+
+    def __init__(self, documents: list[dict]):
+        self._documents = documents
+
+    async def find(self, *args, **kwargs):
+        for doc in self._documents:
+            yield doc
+
+
+async def load_into_mongo(mongo_url: str, documents: list[dict]):
+    """写入本地 MongoDB 的基准测试数据库，返回集合"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    collection = AsyncIOMotorClient(mongo_url)[BENCHMARK_DATABASE][USER_COURSE_SCORE_COLLECTION]
+    await collection.drop()
+
+    batch_size = 10000
+    for start in range(0, len(documents), batch_size):
+        await collection.insert_many(documents[start:start + batch_size], ordered=False)
+    await collection.create_index([("user_id", 1), ("course_id", 1)], unique=True)
+    return collection
+
+
+class StageTimer:
+    """阶段计时与峰值内存统计"""
+
+    def __init__(self):
+        self.results: dict[str, dict] = {}
+
+    def measure(self, name: str, trace_memory: bool = True):
+        """
+        :param trace_memory: 是否统计峰值内存（tracemalloc 会拖慢纯 Python 代码，测吞吐时关闭）
+        """
+        timer = self
+
+        class _Stage:
+            def __enter__(self):
+                if trace_memory:
+                    tracemalloc.start()
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                elapsed = time.perf_counter() - self.start
+                peak = 0
+                if trace_memory:
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                timer.results[name] = {"seconds": round(elapsed, 4), "peak_mb": round(peak / 1024 / 1024, 2)}
+
+        return _Stage()
+
+
+async def run_scale(args, n_events: int) -> dict:
+    """运行单个规模的基准测试"""
+    timer = StageTimer()
+
+    with timer.measure("generate"):
+        events = generate_events(n_events, args.users, args.courses, args.skew, args.seed)
+        documents = rollup_events(events)
+        attributes = generate_attributes(args.courses, args.seed)
+
+    recommender = ItemBasedCFRecommender()
+    if args.mongo_url:
+        with timer.measure("load"):
+            recommender._score_collection = await load_into_mongo(args.mongo_url, documents)
+    else:
+        recommender._score_collection = InMemoryScoreCollection(documents)
+
+    with timer.measure("matrix"):
+        user_item_matrix, course_ids, user_ids = await recommender._build_user_item_matrix()
+
+    with timer.measure("similarity"):
+        k = min(args.k, len(course_ids) - 1)
+        neighbour_indices, neighbour_scores = compute_hybrid_top_k(
+            user_item_matrix,
+            attributes.take(course_ids),
+            k,
+            recommender.SIMILARITY_BLOCK_SIZE,
+            recommender.BEHAVIOR_WEIGHT,
+            recommender.ATTRIBUTE_WEIGHT,
+        )
+
+    with timer.measure("index"):
+        model = ItemSimilarityModel.from_top_k(np.array(course_ids), neighbour_indices, neighbour_scores)
+
+    # 从用户-物品矩阵中抽样真实用户画像进行打分
+    rng = np.random.default_rng(args.seed)
+    sample_rows = rng.choice(user_item_matrix.shape[0], size=min(args.queries, user_item_matrix.shape[0]), replace=False)
+    profiles = []
+    for row in sample_rows:
+        start, end = user_item_matrix.indptr[row], user_item_matrix.indptr[row + 1]
+        profiles.append({
+            course_ids[col]: float(value)
+            for col, value in zip(user_item_matrix.indices[start:end], user_item_matrix.data[start:end])
+        })
+
+    with timer.measure("scoring", trace_memory=False):
+        for profile in profiles:
+            model.score(profile)
+    scoring = timer.results["scoring"]
+    scoring["queries"] = len(profiles)
+    scoring["qps"] = round(len(profiles) / scoring["seconds"], 1) if scoring["seconds"] else None
+
+    return {
+        "events": n_events,
+        "users": len(user_ids),
+        "courses": len(course_ids),
+        "nnz": int(user_item_matrix.nnz),
+        "model_neighbours": int(len(model.neighbour_indices)),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        "stages": timer.results,
+    }
+
+
+def print_report(results: list[dict]):
+    print(f"{'events':>10} {'stage':<12} {'seconds':>10} {'peak_mb':>10} {'qps':>10}")
+    for result in results:
+        for stage, stats in result["stages"].items():
+            qps = stats.get("qps")
+            print(f"{result['events']:>10} {stage:<12} {stats['seconds']:>10.4f} {stats['peak_mb']:>10.2f} "
+                  f"{qps if qps is not None else '':>10}")
+        print(f"{result['events']:>10} users={result['users']} courses={result['courses']} "
+              f"nnz={result['nnz']} max_rss={result['max_rss_mb']}MB")
+
+
+def compare_with_baseline(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """与基线结果比较，返回退化的阶段"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["events"]: r for r in json.load(f)}
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result["events"])
+        if not base:
+            continue
+        for stage, stats in result["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if not base_stats or stage in ("generate", "load"):
+                continue
+            for metric in ("seconds", "peak_mb"):
+                if (stats[metric] > base_stats[metric] * (1 + tolerance)
+                        and stats[metric] - base_stats[metric] > MIN_DELTA[metric]):
+                    regressions.append(
+                        f"events={result['events']} {stage}.{metric}: {base_stats[metric]} -> {stats[metric]}"
+                    )
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="推荐器基准测试")
+    parser.add_argument("--events", default="10000,100000", help="行为数量，逗号分隔多个规模")
+    parser.add_argument("--users", type=int, default=10000, help="用户数")
+    parser.add_argument("--courses", type=int, default=2000, help="课程数")
+    parser.add_argument("--skew", type=float, default=1.1, help="课程热度 Zipf 指数")
+    parser.add_argument("--k", type=int, default=50, help="每个课程保留的近邻数")
+    parser.add_argument("--queries", type=int, default=1000, help="打分阶段的请求数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", default=None, help="使用本地 MongoDB 而不是内存替身")
+    parser.add_argument("--output", default=None, help="结果保存为 JSON")
+    parser.add_argument("--baseline", default=None, help="基线结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例")
+    args = parser.parse_args()
+
+    results = []
+    for n_events in [int(e) for e in args.events.split(",")]:
+        results.append(await run_scale(args, n_events))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("性能退化:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("未发现性能退化")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
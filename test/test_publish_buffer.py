@@ -0,0 +1,75 @@
+"""
+发布缓冲区溢出文件回放测试：损坏的行不影响其余消息，遗留的回放中文件会被找回
+python -m pytest -q test/test_publish_buffer.py
+"""
+import asyncio
+import json
+import os
+
+from core.rabbitmq_client import PublishBuffer
+
+
+def _buffer(spill_dir) -> PublishBuffer:
+    buffer = PublishBuffer(
+        channels=1, batch_size=10, linger_ms=0, max_backlog=10, overflow="spill", spill_dir=str(spill_dir)
+    )
+    buffer.REPLAY_INTERVAL = 0
+    return buffer
+
+
+def _drain(buffer: PublishBuffer) -> list:
+    items = []
+    while not buffer._queue.empty():
+        items.append(buffer._queue.get_nowait())
+    return items
+
+
+async def _run_replay_loop(buffer: PublishBuffer):
+    task = asyncio.create_task(buffer._replay_loop())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    # 回放任务一直运行到被取消，没有因异常退出
+    assert task.cancelled()
+
+
+def test_replay_skips_truncated_line(tmp_path):
+    buffer = _buffer(tmp_path)
+    buffer._spill([("q", {"n": 1}), ("q", {"n": 2})])
+    # 模拟写入时崩溃留下的不完整行（含被截断的多字节字符）
+    with open(buffer._spill_path, "ab") as f:
+        f.write(json.dumps({"queue": "q", "body": {"name": "甲流"}}, ensure_ascii=False).encode("utf-8")[:-4])
+
+    asyncio.run(_run_replay_loop(buffer))
+
+    assert _drain(buffer) == [("q", {"n": 1}), ("q", {"n": 2})]
+    assert not os.path.exists(buffer._spill_path)
+    with open(buffer._corrupt_path, "rb") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_replay_loop_survives_errors(tmp_path):
+    buffer = _buffer(tmp_path)
+    buffer._spill([("q", {"n": 1})])
+
+    async def broken_replay(path):
+        raise OSError("disk error")
+
+    buffer._replay = broken_replay
+    asyncio.run(_run_replay_loop(buffer))
+
+    # 回放失败的文件改回溢出文件名，稍后重试
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".jsonl")]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".replaying")]
+
+
+def test_recover_orphaned_replaying_file(tmp_path):
+    buffer = _buffer(tmp_path)
+    buffer._spill([("q", {"n": 1})])
+    # 回放期间被杀死的进程遗留的文件（该 pid 不存在）
+    os.rename(buffer._spill_path, f"{buffer._spill_path}.999999999.replaying")
+
+    asyncio.run(_run_replay_loop(buffer))
+
+    assert _drain(buffer) == [("q", {"n": 1})]
+    assert os.listdir(tmp_path) == []